@@ -0,0 +1,182 @@
+# benchmarks/corpus_sintetico.py
+# Generador de corpus sintéticos con las estructuras de carpetas que entiende find_best_sources.
+
+import io
+import os
+import random
+from PIL import Image, ImageDraw, ImageEnhance
+
+# Estructuras de obra soportadas (ver utils_fs.scan_obra_sources):
+#   ocr_docx  -> ocr_docx/<doc>.docx + img_pdf/<doc>.pdf
+#   ocr_pdf   -> ocr_pdf/<doc>.pdf (con capa de texto) + img_pdf/<doc>.pdf
+#   img_pdf   -> img_pdf/<doc>.pdf (páginas escaneadas, sin capa de texto)
+#   root_pdf  -> <doc>.pdf en la raíz de la obra
+#   root_docx -> <doc>.docx en la raíz de la obra
+LAYOUTS = ("ocr_docx", "ocr_pdf", "img_pdf", "root_pdf", "root_docx")
+
+# Tamaño de página A4 a 150 ppp para las páginas escaneadas
+PAGE_SIZE = (1240, 1754)
+WORDS = ("tlahtolli", "amoxtli", "altepetl", "calli", "tonatiuh", "metztli", "documento", "obra", "capítulo",
+         "historia", "comunidad", "lengua", "escritura", "registro", "memoria", "territorio", "maíz", "agua")
+
+class SyntheticCorpus:
+    """
+    Genera un corpus reproducible (misma semilla, mismos archivos) de obras con páginas de
+    texto e imágenes. Una fracción duplicate_rate de las imágenes son copias ligeramente
+    alteradas de imágenes anteriores del corpus, para ejercitar la detección de casi
+    duplicados y la caché de descripciones.
+    """
+
+    def __init__(self, seed: int = 0, pages: int = 4, images_per_page: float = 1.0, duplicate_rate: float = 0.1):
+        self.rng = random.Random(seed)
+        self.pages = pages
+        self.images_per_page = images_per_page
+        self.duplicate_rate = duplicate_rate
+        self._originals = []
+        self.stats = {"obras": 0, "documents": 0, "pages": 0, "images": 0, "duplicate_images": 0, "bytes": 0}
+
+    def _text(self, words: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+    def _new_image(self) -> Image.Image:
+        """Figura sintética: fondo en degradado con formas y ruido, distinta para cada semilla."""
+        width, height = self.rng.randint(300, 700), self.rng.randint(250, 600)
+        image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        image = Image.blend(image, Image.new("RGB", (width, height), tuple(self.rng.randint(0, 255) for _ in range(3))), 0.6)
+        draw = ImageDraw.Draw(image)
+        for _ in range(self.rng.randint(3, 12)):
+            x0, y0 = self.rng.randint(0, width - 20), self.rng.randint(0, height - 20)
+            box = (x0, y0, self.rng.randint(x0 + 10, width), self.rng.randint(y0 + 10, height))
+            color = tuple(self.rng.randint(0, 255) for _ in range(3))
+            (draw.ellipse if self.rng.random() < 0.5 else draw.rectangle)(box, fill=color, outline=(0, 0, 0))
+        noise = Image.effect_noise((width, height), self.rng.randint(5, 40)).convert("RGB")
+        return Image.blend(image, noise, 0.15)
+
+    def _image(self) -> Image.Image:
+        """Nueva imagen o, con probabilidad duplicate_rate, una casi copia de una anterior."""
+        self.stats["images"] += 1
+        if self._originals and self.rng.random() < self.duplicate_rate:
+            self.stats["duplicate_images"] += 1
+            original = self.rng.choice(self._originals)
+            scale = self.rng.uniform(0.95, 1.05)
+            copy = original.resize((int(original.width * scale), int(original.height * scale)))
+            return ImageEnhance.Brightness(copy).enhance(self.rng.uniform(0.97, 1.03))
+        image = self._new_image()
+        self._originals.append(image)
+        return image
+
+    def _page_contents(self) -> list[tuple[list[str], list[Image.Image]]]:
+        """Párrafos e imágenes de cada página; las imágenes por página siguen una media images_per_page."""
+        pages = []
+        for _ in range(self.pages):
+            image_count = int(self.images_per_page) + (self.rng.random() < self.images_per_page % 1)
+            paragraphs = [self._text(self.rng.randint(25, 60)) for _ in range(self.rng.randint(3, 6))]
+            pages.append((paragraphs, [self._image() for _ in range(image_count)]))
+        self.stats["pages"] += len(pages)
+        return pages
+
+    def _write_scanned_pdf(self, path: str, pages: list):
+        """PDF de páginas rasterizadas, como el de un libro escaneado (sin capa de texto)."""
+        rendered = []
+        for paragraphs, images in pages:
+            page = Image.new("RGB", PAGE_SIZE, "white")
+            draw = ImageDraw.Draw(page)
+            y = 80
+            for paragraph in paragraphs:
+                for start in range(0, len(paragraph), 90):
+                    draw.text((90, y), paragraph[start:start + 90], fill="black")
+                    y += 18
+                y += 18
+            for image in images:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((PAGE_SIZE[0] - 180, 500))
+                if y + thumbnail.height > PAGE_SIZE[1] - 60:
+                    break
+                page.paste(thumbnail, (90, y))
+                y += thumbnail.height + 30
+            rendered.append(page)
+        rendered[0].save(path, "PDF", save_all=True, append_images=rendered[1:], resolution=150)
+
+    def _write_text_pdf(self, path: str, pages: list):
+        """PDF con capa de texto (como el de un OCR) e imágenes incrustadas."""
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib import pyplot
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        with PdfPages(path) as pdf:
+            for paragraphs, images in pages:
+                figure = pyplot.figure(figsize=(8.27, 11.69))
+                y = 0.95
+                for paragraph in paragraphs:
+                    for start in range(0, len(paragraph), 95):
+                        figure.text(0.08, y, paragraph[start:start + 95], fontsize=9)
+                        y -= 0.016
+                    y -= 0.012
+                for index, image in enumerate(images):
+                    height = min(0.3, max(0.05, y - 0.05) / max(1, len(images) - index))
+                    if y - height < 0.03:
+                        break
+                    axes = figure.add_axes((0.1, y - height, 0.8, height))
+                    axes.imshow(image)
+                    axes.axis("off")
+                    y -= height + 0.02
+                pdf.savefig(figure)
+                pyplot.close(figure)
+
+    def _write_docx(self, path: str, pages: list):
+        import docx
+        from docx.shared import Inches
+
+        document = docx.Document()
+        for page_index, (paragraphs, images) in enumerate(pages):
+            for paragraph in paragraphs:
+                document.add_paragraph(paragraph)
+            for image in images:
+                buffer = io.BytesIO()
+                image.save(buffer, "PNG")
+                buffer.seek(0)
+                document.add_picture(buffer, width=Inches(4))
+            if page_index < len(pages) - 1:
+                document.add_page_break()
+        document.save(path)
+
+    def write_obra(self, obra_path: str, layout: str, documents: int = 1):
+        """Escribe una obra con la estructura indicada, fragmentada en documents archivos."""
+        if layout not in LAYOUTS:
+            raise ValueError(f"Estructura desconocida: {layout}. Opciones: {', '.join(LAYOUTS)}")
+        os.makedirs(obra_path, exist_ok=True)
+        for index in range(1, documents + 1):
+            name = f"parte_{index:02d}"
+            pages = self._page_contents()
+            if layout == "ocr_docx":
+                paths = [(os.path.join(obra_path, "ocr_docx", f"{name}.docx"), self._write_docx),
+                         (os.path.join(obra_path, "img_pdf", f"{name}.pdf"), self._write_scanned_pdf)]
+            elif layout == "ocr_pdf":
+                paths = [(os.path.join(obra_path, "ocr_pdf", f"{name}.pdf"), self._write_text_pdf),
+                         (os.path.join(obra_path, "img_pdf", f"{name}.pdf"), self._write_scanned_pdf)]
+            elif layout == "img_pdf":
+                paths = [(os.path.join(obra_path, "img_pdf", f"{name}.pdf"), self._write_scanned_pdf)]
+            elif layout == "root_pdf":
+                paths = [(os.path.join(obra_path, f"{name}.pdf"), self._write_text_pdf)]
+            else:
+                paths = [(os.path.join(obra_path, f"{name}.docx"), self._write_docx)]
+
+            for path, write in paths:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write(path, pages)
+                self.stats["bytes"] += os.path.getsize(path)
+            self.stats["documents"] += 1
+        self.stats["obras"] += 1
+
+def generate_corpus(corpus_dir: str, obras: int, layouts: list[str], documents_per_obra: int = 1, pages: int = 4,
+                    images_per_page: float = 1.0, duplicate_rate: float = 0.1, seed: int = 0) -> dict:
+    """
+    Genera obras numeradas ('1', '2', ...) en corpus_dir repartiendo las estructuras de
+    layouts por turnos. Devuelve los totales del corpus (obras, documentos, páginas,
+    imágenes, imágenes duplicadas y bytes).
+    """
+    corpus = SyntheticCorpus(seed=seed, pages=pages, images_per_page=images_per_page, duplicate_rate=duplicate_rate)
+    for index in range(obras):
+        corpus.write_obra(os.path.join(corpus_dir, str(index + 1)), layouts[index % len(layouts)], documents_per_obra)
+    return corpus.stats
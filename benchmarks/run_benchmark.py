@@ -0,0 +1,178 @@
+# benchmarks/run_benchmark.py
+# Banco de pruebas de rendimiento: corpus sintético + servidor de visión simulado + pipeline completo.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# Permite ejecutar el script directamente (python benchmarks/run_benchmark.py) desde cualquier directorio
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import config
+from benchmarks.corpus_sintetico import LAYOUTS, generate_corpus
+from benchmarks.servidor_simulado import StubVisionServer
+
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "resultados")
+# Métricas por etapa que se guardan y se comparan con la línea base
+STAGE_FIELDS = ("runs", "failed", "wall_s", "cpu_s", "images", "images_per_s", "peak_rss_mb", "read_bytes", "written_bytes",
+                "model_requests", "latency_p50_s", "latency_p95_s")
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args) -> dict:
+    """
+    Genera el corpus (o usa uno existente), arranca el servidor simulado, procesa el corpus
+    con main_corpus.main y devuelve el resultado a partir del resumen de métricas de la
+    ejecución (ver modulos/metricas.py).
+    """
+    import main_corpus
+
+    base_dir = tempfile.mkdtemp(prefix="benchmark_")
+    corpus_dir = args.corpus or os.path.join(base_dir, "corpus")
+    corpus_stats = None
+    if not args.corpus:
+        start = time.perf_counter()
+        corpus_stats = generate_corpus(corpus_dir, args.obras, args.layouts, args.documents, args.pages,
+                                       args.images_per_page, args.duplicate_rate, args.seed)
+        print(f"Corpus sintético generado en {time.perf_counter() - start:.1f} s: {corpus_stats}")
+
+    server = StubVisionServer(args.latency, args.jitter, args.per_image_latency, args.error_rate, seed=args.seed).start()
+    # La descripción se ejecuta en el proceso principal, así que basta con cambiar la configuración aquí
+    config.OLLAMA_CONFIG["API_ENDPOINT_CHAT"] = server.url
+    config.OLLAMA_CONFIG["ENDPOINTS"] = []
+    config.OLLAMA_CONFIG["MAX_CONCURRENT_REQUESTS"] = args.concurrency
+    config.OLLAMA_CONFIG["ENDPOINT_COOLDOWN"] = args.cooldown
+    config.DESCRIPTION_BATCH_CONFIG.update(ENABLED=args.batch, MAX_IMAGES=args.batch_size, MAX_SIDE_PX=args.batch_max_side)
+    config.METRICS_CONFIG["ENABLED"] = True
+
+    output_dir = None
+    try:
+        start = time.perf_counter()
+        output_dir = main_corpus.main(corpus_dir, workers=args.workers, pipelined=args.pipelined)
+        total_wall = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    with open(os.path.join(output_dir, config.OUTPUT_DIRS["LOGS"], config.METRICS_CONFIG["SUMMARY_JSON"]), "r", encoding="utf-8") as f:
+        run_summary = json.load(f)
+
+    result = {
+        "name": args.name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "params": {key: value for key, value in vars(args).items() if key not in ("name", "baseline", "tolerance", "keep", "output")},
+        "corpus": corpus_stats,
+        "stub_server": {"requests": server.requests, "images": server.images, "errors": server.errors},
+        "total_wall_s": round(total_wall, 3),
+        "stages": {stage: {field: totals.get(field) for field in STAGE_FIELDS} for stage, totals in run_summary["stages"].items()},
+    }
+
+    if args.keep:
+        print(f"Corpus y directorio de trabajo conservados en: {corpus_dir} / {output_dir}")
+    else:
+        shutil.rmtree(base_dir, ignore_errors=True)
+        if args.corpus:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return result
+
+def _delta(current: float | None, baseline: float | None) -> str:
+    if not current or not baseline:
+        return "-"
+    return f"{(current - baseline) / baseline * 100:+.1f}%"
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Imprime la comparación por etapa con la línea base y devuelve las regresiones: etapas
+    cuyo tiempo de reloj creció (o cuyo rendimiento en imágenes/s bajó) más de tolerance %.
+    """
+    print(f"\nComparación con la línea base '{baseline['name']}' ({baseline['created']}, commit {baseline.get('git_commit')}):")
+    print(f"  {'etapa':<14}{'reloj base':>12}{'reloj':>10}{'Δ reloj':>10}{'img/s base':>12}{'img/s':>10}{'Δ img/s':>10}{'pico MB':>10}")
+    regressions = []
+    for stage, totals in result["stages"].items():
+        base = baseline["stages"].get(stage)
+        if not base:
+            print(f"  {stage:<14}{'(sin línea base)':>12}")
+            continue
+        print(f"  {stage:<14}{base['wall_s']:>12.2f}{totals['wall_s']:>10.2f}{_delta(totals['wall_s'], base['wall_s']):>10}"
+              f"{base['images_per_s'] or 0:>12.2f}{totals['images_per_s'] or 0:>10.2f}"
+              f"{_delta(totals['images_per_s'], base['images_per_s']):>10}{totals['peak_rss_mb']:>10.0f}")
+        if base["wall_s"] and totals["wall_s"] > base["wall_s"] * (1 + tolerance / 100):
+            regressions.append(f"{stage}: tiempo de reloj {_delta(totals['wall_s'], base['wall_s'])}")
+        elif base["images_per_s"] and (totals["images_per_s"] or 0) < base["images_per_s"] * (1 - tolerance / 100):
+            regressions.append(f"{stage}: imágenes/s {_delta(totals['images_per_s'], base['images_per_s'])}")
+    print(f"  {'total':<14}{baseline['total_wall_s']:>12.2f}{result['total_wall_s']:>10.2f}"
+          f"{_delta(result['total_wall_s'], baseline['total_wall_s']):>10}")
+    if baseline["params"] != result["params"]:
+        print("  ADVERTENCIA: Los parámetros de las dos ejecuciones no coinciden; la comparación es orientativa.")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el rendimiento del pipeline con un corpus sintético y un servidor de visión simulado.")
+    parser.add_argument("--name", default="benchmark", help="Nombre de la ejecución (forma parte del archivo de resultados).")
+    corpus_group = parser.add_argument_group("corpus sintético")
+    corpus_group.add_argument("--corpus", default=None, help="Usa un corpus existente en lugar de generar uno.")
+    corpus_group.add_argument("--obras", type=int, default=6)
+    corpus_group.add_argument("--layouts", default=",".join(LAYOUTS),
+                              help=f"Estructuras de obra, repartidas por turnos. Opciones: {', '.join(LAYOUTS)}.")
+    corpus_group.add_argument("--documents", type=int, default=1, help="Archivos por obra (obras fragmentadas).")
+    corpus_group.add_argument("--pages", type=int, default=4, help="Páginas por documento.")
+    corpus_group.add_argument("--images-per-page", type=float, default=1.0, help="Media de imágenes por página.")
+    corpus_group.add_argument("--duplicate-rate", type=float, default=0.1, help="Fracción de imágenes casi duplicadas.")
+    corpus_group.add_argument("--seed", type=int, default=0)
+    server_group = parser.add_argument_group("servidor simulado")
+    server_group.add_argument("--latency", type=float, default=0.5, help="Segundos por petición.")
+    server_group.add_argument("--jitter", type=float, default=0.1, help="Segundos aleatorios adicionales (uniforme).")
+    server_group.add_argument("--per-image-latency", type=float, default=0.0, help="Segundos adicionales por imagen de la petición.")
+    server_group.add_argument("--error-rate", type=float, default=0.0, help="Fracción de peticiones que responden 500.")
+    server_group.add_argument("--concurrency", type=int, default=config.OLLAMA_CONFIG["MAX_CONCURRENT_REQUESTS"])
+    server_group.add_argument("--cooldown", type=float, default=1.0, help="ENDPOINT_COOLDOWN durante la prueba.")
+    pipeline_group = parser.add_argument_group("pipeline")
+    pipeline_group.add_argument("--workers", type=int, default=1)
+    pipeline_group.add_argument("--pipelined", action="store_true")
+    pipeline_group.add_argument("--batch", action="store_true", help="Agrupa las figuras pequeñas en peticiones por lotes.")
+    pipeline_group.add_argument("--batch-size", type=int, default=config.DESCRIPTION_BATCH_CONFIG["MAX_IMAGES"],
+                                help="Imágenes por petición con --batch.")
+    pipeline_group.add_argument("--batch-max-side", type=int, default=config.DESCRIPTION_BATCH_CONFIG["MAX_SIDE_PX"],
+                                help="Lado más largo (px) de las imágenes que se agrupan con --batch.")
+    parser.add_argument("--baseline", default=None, help="Archivo de resultados con el que comparar.")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Porcentaje de empeoramiento que se considera regresión.")
+    parser.add_argument("--output", default=None, help=f"Archivo de resultados (por defecto, en {RESULTS_DIR}).")
+    parser.add_argument("--keep", action="store_true", help="Conserva el corpus y el directorio de trabajo.")
+    args = parser.parse_args()
+    args.layouts = [layout.strip() for layout in args.layouts.split(",") if layout.strip()]
+
+    result = run_benchmark(args)
+
+    output_path = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{args.name}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+
+    print(f"\nResultado ({result['total_wall_s']:.1f} s en total, {result['stub_server']['requests']} peticiones al servidor simulado):")
+    for stage, totals in result["stages"].items():
+        print(f"  {stage:<14}{totals['wall_s']:>8.2f} s de reloj {totals['cpu_s']:>8.2f} s de CPU "
+              f"{totals['images_per_s'] or 0:>8.2f} img/s  pico {totals['peak_rss_mb']:.0f} MB")
+    print(f"Guardado en: {output_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESIONES (más del {:.0f}%):\n  {}".format(args.tolerance, "\n  ".join(regressions)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
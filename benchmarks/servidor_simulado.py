@@ -0,0 +1,82 @@
+# benchmarks/servidor_simulado.py
+# Servidor HTTP que imita el endpoint /api/chat de Ollama con una latencia configurable.
+
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class StubVisionServer:
+    """
+    Responde a las peticiones de chat con una descripción fija tras esperar
+    latency + U(0, jitter) segundos (más per_image por cada imagen de la petición) y falla
+    con un 500 en una fracción error_rate de ellas. Si la petición pide formato JSON (lotes de
+    generador_descripciones), responde con una descripción por imagen en el formato del prompt
+    DESCRIBE_IMAGES_BATCH_ES. Cuenta peticiones e imágenes recibidas.
+    Con port=0 el sistema elige un puerto libre.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, per_image: float = 0.0, error_rate: float = 0.0,
+                 port: int = 0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_image = per_image
+        self.error_rate = error_rate
+        self.requests = 0
+        self.images = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/chat"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                image_count = sum(len(message.get("images", [])) for message in body.get("messages", []))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.images += image_count
+                    delay = stub.latency + stub._rng.uniform(0, stub.jitter) + stub.per_image * image_count
+                    failed = stub._rng.random() < stub.error_rate
+                    stub.errors += failed
+                time.sleep(delay)
+
+                if failed:
+                    payload, status = {"error": "fallo simulado"}, 500
+                elif body.get("format") == "json":
+                    content = json.dumps({"descripciones": [{"imagen": index, "descripcion": f"Descripción simulada de la imagen {index} del lote."}
+                                                            for index in range(1, image_count + 1)]}, ensure_ascii=False)
+                    payload, status = {"model": body.get("model"), "message": {"role": "assistant", "content": content}, "done": True}, 200
+                else:
+                    content = f"Descripción simulada de {image_count} imagen(es)."
+                    payload, status = {"model": body.get("model"), "message": {"role": "assistant", "content": content}, "done": True}, 200
+                output = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(output)))
+                self.end_headers()
+                self.wfile.write(output)
+
+            def log_message(self, *args):
+                pass  # Sin una línea por petición en la consola
+
+        return Handler
+
+    def start(self) -> "StubVisionServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -9,17 +9,149 @@ OLLAMA_CONFIG = {
     "API_ENDPOINT_CHAT": "http://localhost:11434/api/chat",
     "API_ENDPOINT_GENERATE": "http://localhost:11434/api/generate",
     "REQUEST_TIMEOUT": 600,  # Segundos antes de considerar que la petición falló
+    "MAX_CONCURRENT_REQUESTS": 4,  # Peticiones simultáneas al endpoint; igualar a OLLAMA_NUM_PARALLEL del servidor
+    # Hosts de Ollama entre los que se reparten las descripciones. Si la lista está vacía se usa
+    # únicamente API_ENDPOINT_CHAT con MAX_CONCURRENT_REQUESTS.
+    "ENDPOINTS": [
+        # {"URL": "http://gpu-01:11434/api/chat", "WEIGHT": 2, "MAX_CONCURRENT_REQUESTS": 4},
+    ],
+    "ENDPOINT_COOLDOWN": 60,  # Segundos fuera de rotación para un endpoint que agotó el tiempo o respondió 5xx
+    # Timeout adaptativo: con TIMEOUT_MIN_SAMPLES respuestas registradas, el timeout de cada endpoint es
+    # su percentil TIMEOUT_PERCENTILE de latencia por TIMEOUT_MULTIPLIER (entre MIN_TIMEOUT y
+    # REQUEST_TIMEOUT), y se duplica en cada reintento. Hasta entonces se usa REQUEST_TIMEOUT.
+    "ADAPTIVE_TIMEOUT": True,
+    "TIMEOUT_PERCENTILE": 0.99,
+    "TIMEOUT_MULTIPLIER": 3.0,
+    "TIMEOUT_MIN_SAMPLES": 20,
+    "TIMEOUT_WINDOW": 200,  # Número de latencias recientes consideradas
+    "MIN_TIMEOUT": 30,
+    # Reintentos de fallos transitorios (timeout, conexión, 5xx, 429) con espera exponencial aleatoria:
+    # la espera antes del reintento n está entre 0 y min(BACKOFF_MAX, BACKOFF_BASE * 2^n) segundos
+    "MAX_RETRIES": 3,
+    "BACKOFF_BASE": 2.0,
+    "BACKOFF_MAX": 60,
+    # Circuito: tras BREAKER_FAILURES fallos transitorios consecutivos no se envían peticiones durante
+    # BREAKER_COOLDOWN segundos; después, una petición de prueba decide si se vuelve a cerrar
+    "BREAKER_FAILURES": 5,
+    "BREAKER_COOLDOWN": 120,
 }
 
 # --- Configuración de Procesamiento de Imágenes ---
 IMAGE_PROCESSING_CONFIG = {
     "MAX_DIMENSION": 1024,  # El lado más largo de la imagen se redimensionará a este valor
-    "OPTIMIZED_FORMAT": "PNG",
+    # Formato de las imágenes optimizadas: "PNG", "JPEG", "WEBP" o "AUTO" (PNG para dibujos de línea
+    # y figuras con pocos colores, LOSSY_FORMAT para fotografías y escaneos de página)
+    "OPTIMIZED_FORMAT": "AUTO",
+    "LOSSY_FORMAT": "JPEG",  # Formato con pérdida que usa AUTO
+    "JPEG_QUALITY": 85,
+    "WEBP_QUALITY": 80,
+    "MIN_QUALITY": 45,  # Calidad mínima a la que se puede bajar para cumplir MAX_PAYLOAD_BYTES
+    "LINE_ART_MAX_COLORS": 48,  # AUTO: número máximo de colores (cuantizados) para considerar una imagen dibujo de línea
+    "MAX_PAYLOAD_BYTES": 350_000,  # Tamaño objetivo del archivo enviado al modelo (0 = sin límite)
+    "WORKERS": None,  # Procesos para optimizar las imágenes de una obra (None = todos los núcleos, 1 = sin pool)
+    "METADATA_BATCH_SIZE": 200,  # Cada cuántas imágenes optimizadas se guarda metadatos.json
+    # Filtro de imágenes triviales (motas, bordes de página, regiones lisas) que no se envían al modelo
+    "SKIP_TRIVIAL_IMAGES": True,
+    "MIN_SIDE_PX": 24,  # Lado más corto mínimo en píxeles
+    "MIN_AREA_PX": 2500,  # Área mínima en píxeles
+    "MAX_ASPECT_RATIO": 15.0,  # Proporción máxima lado largo / lado corto (descarta filetes y bordes)
+    "MIN_STD_DEV": 6.0,  # Desviación estándar mínima de la luminancia (0-255); por debajo es un color sólido
+}
+
+# --- Configuración del Ensamblaje del Markdown ---
+ASSEMBLY_CONFIG = {
+    # Qué hacer con las imágenes marcadas como "skipped": "stub" (enlazar la imagen sin descripción,
+    # para que una omisión equivocada se vea en el Markdown) u "omit" (eliminar el placeholder)
+    "SKIPPED_IMAGES": "stub",
+}
+
+# --- Configuración de Docling ---
+DOCLING_CONFIG = {
+    # Los DocumentConverter se reutilizan entre obras; se recrean tras este número de documentos convertidos
+    "CONVERTER_MAX_DOCUMENTS": 200,
+    # ...o cuando la memoria residente del proceso supere este umbral en MB (0 = sin límite)
+    "CONVERTER_MAX_RSS_MB": 12288,
+    # Los PDF con al menos CHUNK_MIN_PAGES páginas se convierten por rangos de CHUNK_PAGES páginas,
+    # repartidos entre CHUNK_WORKERS procesos (cada uno con sus propios modelos cargados)
+    "CHUNK_MIN_PAGES": 150,
+    "CHUNK_PAGES": 50,
+    "CHUNK_WORKERS": 2,
+}
+
+# --- Perfiles de Docling por Tipo de Fuente ---
+# Opciones del pipeline de PDF según la carpeta de la obra de la que proviene cada archivo
+# (ver utils_fs.SOURCE_SUBDIRS); los PDF de la raíz de la obra usan "default". Los DOCX
+# (ocr_docx/ o raíz) siempre usan el backend de Word de Docling, que no ejecuta modelos.
+# Un archivo que solo aporta imágenes se convierte además sin OCR ni estructura de tablas.
+#   DO_OCR: reconocer el texto de las páginas rasterizadas
+#   DO_TABLE_STRUCTURE / TABLE_MODE: modelo de tablas, "FAST" o "ACCURATE"
+#   PDF_BACKEND: "pypdfium2" (más rápido) o None (backend por defecto de Docling, mejor lectura de la capa de texto)
+DOCLING_PROFILES = {
+    # PDF con capa de texto de un OCR previo: no se repite el OCR
+    "ocr_pdf": {"DO_OCR": False, "DO_TABLE_STRUCTURE": True, "TABLE_MODE": "FAST", "PDF_BACKEND": None},
+    # PDF escaneado: el OCR solo importa si es la única fuente de texto; sin modelo de tablas
+    "img_pdf": {"DO_OCR": True, "DO_TABLE_STRUCTURE": False, "TABLE_MODE": "FAST", "PDF_BACKEND": "pypdfium2"},
+    # PDF en la raíz de la obra, de tipo desconocido: configuración completa de Docling
+    "default": {"DO_OCR": True, "DO_TABLE_STRUCTURE": True, "TABLE_MODE": "ACCURATE", "PDF_BACKEND": None},
+}
+
+# --- Caché de Descripciones ---
+# Base SQLite que asocia (hash SHA-256 de la imagen optimizada, modelo, prompt) con su descripción,
+# para no enviar al modelo imágenes ya descritas (logos, sellos, páginas en blanco...).
+DESCRIPTION_CACHE_CONFIG = {
+    "ENABLED": True,
+    "FILENAME": "cache_descripciones.sqlite",  # Se crea en la raíz del directorio de trabajo
+    "PATH": None,  # Ruta explícita para compartir la caché entre varios directorios de trabajo
+    "MAX_SIZE_MB": 256,  # Al superarse se eliminan las entradas usadas hace más tiempo
+}
+
+# --- Descripción por Lotes ---
+# Las figuras pequeñas se envían juntas en una sola petición (varias entradas en "images") con el
+# prompt DESCRIBE_IMAGES_BATCH_ES, que pide una descripción por imagen en JSON. Si la respuesta no
+# se puede interpretar, cada imagen del lote se describe con su propia petición.
+DESCRIPTION_BATCH_CONFIG = {
+    "ENABLED": False,
+    "MAX_IMAGES": 4,  # Imágenes por petición
+    "MAX_SIDE_PX": 384,  # Solo se agrupan imágenes optimizadas cuyo lado más largo no supera este valor
+}
+
+# --- Detección de Imágenes Casi Duplicadas ---
+# Tras la optimización se calcula un hash perceptual (dHash) por imagen; las que quedan a poca
+# distancia de Hamming de otra ya vista (en la obra o en el corpus) reutilizan su descripción.
+DEDUPLICATION_CONFIG = {
+    "ENABLED": True,
+    "INDEX_FILENAME": "indice_imagenes.sqlite",  # Índice del corpus, en la raíz del directorio de trabajo
+    "HASH_SIZE": 8,  # Lado de la rejilla del dHash (8 -> hash de 64 bits)
+    "MAX_DISTANCE": 5,  # Distancia de Hamming máxima para considerar dos imágenes casi idénticas
+}
+
+# --- Descubrimiento del Corpus ---
+# Un único recorrido paralelo del corpus produce un manifiesto (obra -> fuentes elegidas,
+# tamaños y fechas) que usan todos los orquestadores en lugar de volver a listar carpetas.
+DISCOVERY_CONFIG = {
+    "MANIFEST_FILENAME": "manifiesto_fuentes.json",  # Se crea en la raíz del directorio de trabajo
+    "WORKERS": 16,  # Hilos del recorrido; conviene subirlo en sistemas de archivos de red (NFS)
+}
+
+# --- Estado de los Trabajos ---
+# Base SQLite con el estado de cada etapa de cada obra (fuentes, extracción, optimización,
+# duplicados, descripciones N/M, ensamblaje), sus huellas de entrada y sus tiempos.
+# Los orquestadores la usan para reanudar cada obra en la etapa en que se detuvo.
+JOB_STATE_CONFIG = {
+    "FILENAME": "estado_pipeline.sqlite",  # Se crea en la raíz del directorio de trabajo
+    "FINGERPRINT_CONTENT_HASH": False,  # Incluir el SHA-256 de cada fuente en su huella (más lento, inmune a cambios solo de fecha)
 }
 
 # --- Prompts para la IA ---
 PROMPTS = {
     "DESCRIBE_IMAGE_ES": "Describe esta imagen en detalle y en español. Explica su propósito y contenido dentro de un documento técnico.",
+    # Descripción por lotes; {count} se sustituye por el número de imágenes adjuntas
+    "DESCRIBE_IMAGES_BATCH_ES": (
+        "Recibirás {count} imágenes, numeradas del 1 al {count} en el orden en que se adjuntan. Describe cada una "
+        "en detalle y en español. Explica su propósito y contenido dentro de un documento técnico. Responde solo "
+        "con un objeto JSON de la forma {{\"descripciones\": [{{\"imagen\": 1, \"descripcion\": \"...\"}}]}}, "
+        "con exactamente {count} elementos, uno por imagen y en el mismo orden."
+    ),
     # Aquí se pueden añadir más prompts en el futuro, ej. para extraer tablas o resumir texto.
 }
 
@@ -40,13 +172,37 @@ ARTIFACT_SUBDIRS = {
     "OPTIMIZED_IMAGES": "imagenes_optimizadas",
     "TABLES": "tablas_extraidas",
     "METADATA": "metadatos.json",
+    "METADATA_JOURNAL": "metadatos_diario.jsonl",  # Cambios por imagen pendientes de integrar en metadatos.json
+    "SOURCE_FINGERPRINTS": "huellas_fuentes.json",  # Huellas de los archivos fuente, para el modo incremental
 }
 
 # --- Configuración del Log ---
 LOG_CONFIG = {
     "FILENAME": "bitacora_procesamiento.log",
+    "WORKER_FILENAME": "bitacora_trabajador_{pid}.log",  # Log temporal de cada proceso trabajador; se fusiona al final
     "LEVEL": "INFO", # Nivel de log: DEBUG, INFO, WARNING, ERROR, CRITICAL
 }
 
+# --- Métricas de Ejecución ---
+# Cada etapa de cada obra registra tiempo de reloj, CPU, pico de memoria, E/S, imágenes y
+# latencias del modelo; al final de la ejecución se escribe un resumen en 00_log.
+METRICS_CONFIG = {
+    "ENABLED": True,
+    "RECORDS_FILENAME": "metricas_{pid}.jsonl",  # Registros temporales de cada proceso; se agregan al final
+    "SUMMARY_JSON": "resumen_ejecucion.json",
+    "SUMMARY_CSV": "resumen_ejecucion.csv",
+    "PROMETHEUS_FILENAME": None,  # Ej. "metricas_pipeline.prom" (o una ruta absoluta al directorio del textfile collector)
+}
+
+# --- Configuración de Procesamiento en Paralelo ---
+PARALLEL_CONFIG = {
+    "WORKERS": 1,  # Número de obras procesadas simultáneamente (1 = secuencial, sin procesos adicionales)
+    "MAX_PENDING_PER_WORKER": 2,  # Tamaño de la cola acotada: obras enviadas por trabajador aún sin terminar
+    "START_METHOD": "spawn",  # 'spawn' evita heredar estado de CUDA/PyTorch del proceso principal
+    "DESCRIPTION_OBRAS": 2,  # Obras describiéndose a la vez en el proceso principal mientras los trabajadores extraen
+    "MAX_DESCRIPTION_BACKLOG": 4,  # Obras extraídas esperando descripción antes de dejar de enviar nuevas extracciones
+    "MAX_DESCRIPTION_DEFERRALS": 3,  # Veces que una obra vuelve a la cola de descripción porque el circuito de Ollama estaba abierto
+}
+
 # --- Extensiones de Archivo Soportadas ---
 SUPPORTED_EXTENSIONS = ['.pdf', '.docx']
@@ -4,7 +4,7 @@
 import os
 import sys
 import config
-from modulos import utils_fs, procesador_documentos, procesador_imagenes, generador_descripciones, ensamblador_markdown
+from modulos import utils_fs, flujo_obra, estado_trabajos, cliente_ollama, metricas
 
 def main(input_directory: str):
     """
@@ -20,6 +20,7 @@ def main(input_directory: str):
     # 2. Configurar el directorio de salida principal
     output_dir = utils_fs.setup_main_output_dir(input_directory, config.OUTPUT_DIRS)
     print(f"Directorio de trabajo configurado en: {output_dir}")
+    state = estado_trabajos.open_state(output_dir)
 
     # 3. Bucle principal de procesamiento por documento
     for filename in sorted(os.listdir(input_directory)):
@@ -34,38 +35,27 @@ def main(input_directory: str):
         print(f"\n{'='*60}\nProcesando: {filename}\n{'='*60}")
 
         # --- Lógica de reanudación ---
-        final_md_path = os.path.join(output_dir, config.OUTPUT_DIRS["FINAL_MARKDOWN"], f"{doc_basename}.md")
-        if os.path.exists(final_md_path):
+        if not flujo_obra.pending_obras(state, output_dir, [doc_basename]):
             print(f"  RESULTADO FINAL YA EXISTE. Saltando procesamiento de {filename}.")
             continue
 
         # --- Copiar documento original (Paso 0) ---
-        utils_fs.copy_original_document(source_doc_path, output_dir, config)
+        utils_fs.copy_original_document(source_doc_path, output_dir, {"OUTPUT_DIRS": config.OUTPUT_DIRS})
         print(f"Copiado a la carpeta de originales: {filename}")
 
-        # --- Paso 1: Extracción de Artefactos ---
-        doc_artifact_path = procesador_documentos.extract_artifacts(source_doc_path, output_dir)
-        if not doc_artifact_path:
-            print(f"  FALLO CRÍTICO: No se pudieron extraer los artefactos para {filename}. Saltando al siguiente documento.")
+        # --- Pasos 1 a 4: cadena reanudable, con el documento como única fuente de texto e imágenes ---
+        sources = {"text": [source_doc_path], "image": [source_doc_path]}
+        if not flujo_obra.process_obra(input_directory, output_dir, doc_basename, state, sources=sources):
+            print(f"  FALLO CRÍTICO: No se pudo completar el procesamiento de {filename}. Saltando al siguiente documento.")
             continue
 
-        # --- Paso 2: Optimización de Imágenes ---
-        if not procesador_imagenes.optimize_images_for_doc(doc_artifact_path):
-            print(f"  FALLO CRÍTICO: No se pudieron optimizar las imágenes para {filename}. Saltando al siguiente documento.")
-            continue
-
-        # --- Paso 3: Generación de Descripciones ---
-        if not generador_descripciones.generate_descriptions_for_doc(doc_artifact_path):
-            print(f"  FALLO CRÍTICO: No se pudieron generar las descripciones para {filename}. Saltando al siguiente documento.")
-            continue
-
-        # --- Paso 4: Ensamblaje del Markdown ---
-        if not ensamblador_markdown.assemble_markdown_for_doc(doc_artifact_path, output_dir):
-            print(f"  FALLO CRÍTICO: No se pudo ensamblar el Markdown para {filename}. Saltando al siguiente documento.")
-            continue
-        
         print(f"  PROCESAMIENTO COMPLETADO CON ÉXITO PARA: {filename}")
 
+    state.close()
+
+    # Agregar los registros de métricas de la ejecución en el resumen de 00_log, como main_corpus.py
+    cliente_ollama.log_endpoint_stats()
+    metricas.write_run_report(output_dir)
     print("\n--- PIPELINE COMPLETADO ---")
 
 if __name__ == "__main__":
@@ -2,71 +2,259 @@
 # Orquestador especializado para procesar corpus estructurados por carpetas.
 
 import os
-import sys
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import config
-from modulos import utils_fs, procesador_documentos, procesador_imagenes, generador_descripciones, ensamblador_markdown
+from modulos import utils_fs, flujo_obra, estado_trabajos, descubrimiento_corpus, cliente_ollama, metricas
 import logging
 
-def main(corpus_directory: str):
+# Etapas que se ejecutan en los procesos trabajadores; la descripción y el ensamblaje
+# se ejecutan en hilos del proceso principal
+CPU_STAGES = estado_trabajos.STAGES[:estado_trabajos.STAGES.index("deduplicated") + 1]
+CPU_LAST_STAGE = CPU_STAGES[-1]
+
+# Conexión al estado de trabajos propia de cada proceso trabajador
+_worker_state = None
+
+def _init_worker(log_dir: str, output_dir: str):
+    """
+    Inicializador de cada proceso trabajador: redirige su logging a un archivo propio y abre
+    su conexión al estado de trabajos. El paralelismo ya está entre obras, así que cada
+    trabajador convierte sus PDF y optimiza sus imágenes sin pools propios.
+    """
+    global _worker_state
+    utils_fs.setup_worker_logging(log_dir, config.LOG_CONFIG)
+    _worker_state = estado_trabajos.open_state(output_dir)
+    config.IMAGE_PROCESSING_CONFIG["WORKERS"] = 1
+    config.DOCLING_CONFIG["CHUNK_WORKERS"] = 1
+
+def _process_obra_in_worker(obra_path: str, output_dir: str, obra_dir_name: str, sources: dict | None) -> tuple[str, bool]:
+    """
+    Punto de entrada en el proceso trabajador: ejecuta las etapas de CPU de la obra (hasta
+    la detección de duplicados). Nunca propaga excepciones al proceso principal.
+    """
+    try:
+        success = flujo_obra.process_obra(obra_path, output_dir, obra_dir_name, _worker_state, sources=sources, last_stage=CPU_LAST_STAGE)
+    except Exception as e:
+        logging.exception(f"  FALLO CRÍTICO: Error inesperado procesando la obra {obra_dir_name}: {e}")
+        success = False
+    return obra_dir_name, success
+
+def _describe_and_assemble(obra_path: str, output_dir: str, obra_dir_name: str) -> tuple[str, bool]:
+    """
+    Etapas finales de una obra (descripción y ensamblaje), en un hilo del proceso principal.
+    Cada hilo abre su propia conexión al estado de trabajos.
+    """
+    state = estado_trabajos.open_state(output_dir)
+    try:
+        success = flujo_obra.process_obra(obra_path, output_dir, obra_dir_name, state)
+    except Exception as e:
+        logging.exception(f"  FALLO CRÍTICO: Error inesperado describiendo la obra {obra_dir_name}: {e}")
+        success = False
+    finally:
+        state.close()
+    return obra_dir_name, success
+
+def order_by_cost(obra_dir_names: list[str], manifest: dict, history_dir: str | None = None) -> list[str]:
+    """
+    Ordena las obras de mayor a menor coste estimado (primero el trabajo más largo), para que
+    un libro escaneado enorme no empiece al final y alargue la cola de la ejecución. El coste
+    sale del tamaño de las fuentes en el manifiesto y, si se indica history_dir, de las
+    duraciones registradas en el estado de una ejecución anterior del mismo corpus.
+    """
+    durations = {}
+    if history_dir:
+        history_state_path = os.path.join(history_dir, config.JOB_STATE_CONFIG["FILENAME"])
+        if os.path.exists(history_state_path):
+            history_state = estado_trabajos.JobState(history_state_path)
+            durations = history_state.durations(estado_trabajos.STAGES)
+            history_state.close()
+        else:
+            logging.warning(f"  ADVERTENCIA: No hay estado de trabajos en {history_dir}; el coste se estima solo por tamaño.")
+    costs = descubrimiento_corpus.estimate_costs(manifest, obra_dir_names, durations)
+    ordered = sorted(obra_dir_names, key=lambda name: costs[name], reverse=True)
+    logging.info(f"Obras ordenadas por coste estimado ({sum(1 for name in obra_dir_names if name in durations)} con duración "
+                 f"registrada). Primeras: {', '.join(ordered[:5])}")
+    return ordered
+
+def run_pipelined(corpus_directory: str, output_dir: str, obra_dir_names: list[str], workers: int, state: estado_trabajos.JobState,
+                  manifest: dict):
+    """
+    Procesa las obras, en el orden recibido, como una cadena de dos grupos de trabajadores
+    conectados por una cola acotada: un pool de procesos ejecuta las etapas de CPU (extracción con Docling,
+    optimización, duplicados) y un pool de hilos del proceso principal ejecuta la
+    descripción con Ollama y el ensamblaje. Así la obra N+1 se extrae mientras se
+    describen las imágenes de la obra N. Si se acumulan MAX_DESCRIPTION_BACKLOG obras
+    extraídas esperando descripción, no se envían más obras a extraer. Los trabajadores
+    toman la siguiente obra de la cola común en cuanto quedan libres, así que con las obras
+    ordenadas por coste las más largas empiezan primero y las cortas rellenan los huecos.
+    Mientras el circuito de Ollama está abierto no se despachan descripciones y se ignora la
+    contrapresión, de modo que los trabajadores siguen extrayendo otras obras; una obra cuya
+    descripción falla con el circuito abierto vuelve a la cola (hasta MAX_DESCRIPTION_DEFERRALS veces).
+    Si un proceso trabajador muere (ej. por el OOM killer), el pool entero queda roto: las
+    obras que estaban en él se dan por fallidas (se reintentarán al reanudar), se crea un
+    pool nuevo y la ejecución continúa con las demás.
     """
-    Función principal que orquesta el pipeline para un corpus estructurado.
+    parallel_config = config.PARALLEL_CONFIG
+    log_dir = os.path.join(output_dir, config.OUTPUT_DIRS["LOGS"])
+    max_in_flight = workers * parallel_config["MAX_PENDING_PER_WORKER"]
+    mp_context = multiprocessing.get_context(parallel_config["START_METHOD"])
+    obras_iter = iter(obra_dir_names)
+    extracting = {}  # Futuro -> (obra, generación del pool en que se envió)
+    describing = set()
+    backlog = deque()  # Obras con sus etapas de CPU completadas, esperando descripción
+    deferrals = {}  # Veces que cada obra ha vuelto a la cola por el circuito de Ollama
+    balancer = cliente_ollama.get_balancer()
+    completed, failed = 0, 0
+
+    def finish(obra_dir_name: str, success: bool):
+        nonlocal completed, failed
+        if success:
+            completed += 1
+        else:
+            failed += 1
+        logging.info(f"  [{completed + failed}/{len(obra_dir_names)}] Obra {obra_dir_name} {'completada' if success else 'fallida'}.")
+
+    def new_cpu_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_init_worker, initargs=(log_dir, output_dir))
+
+    cpu_executor = new_cpu_executor()
+    generation = 0
+
+    def replace_broken_executor(broken_generation: int):
+        """Sustituye el pool roto por uno nuevo (una sola vez por pool, aunque fallen varias obras)."""
+        nonlocal cpu_executor, generation
+        if broken_generation != generation:
+            return
+        logging.error("  FALLO CRÍTICO: Un proceso trabajador terminó abruptamente (ej. por falta de memoria). "
+                      "Se crea un nuevo pool de trabajadores.")
+        cpu_executor.shutdown(wait=False, cancel_futures=True)
+        cpu_executor = new_cpu_executor()
+        generation += 1
+
+    def submit_cpu(obra_dir_name: str):
+        obra_path = os.path.join(corpus_directory, obra_dir_name)
+        sources = descubrimiento_corpus.obra_sources(manifest, obra_dir_name)
+        try:
+            future = cpu_executor.submit(_process_obra_in_worker, obra_path, output_dir, obra_dir_name, sources)
+        except BrokenProcessPool:
+            # El pool se rompió antes de que se recogiera el resultado de la obra afectada
+            replace_broken_executor(generation)
+            future = cpu_executor.submit(_process_obra_in_worker, obra_path, output_dir, obra_dir_name, sources)
+        extracting[future] = (obra_dir_name, generation)
+
+    logging.info(f"Procesando {len(obra_dir_names)} obras con {workers} trabajadores de extracción y "
+                 f"{parallel_config['DESCRIPTION_OBRAS']} obras en descripción simultánea.")
+    try:
+        with ThreadPoolExecutor(max_workers=parallel_config["DESCRIPTION_OBRAS"]) as description_executor:
+            while True:
+                # Rellenar la cola de extracción, salvo que la de descripción esté llena (contrapresión).
+                # Con el circuito abierto la descripción no avanza: se adelanta el trabajo de CPU.
+                circuit_open = balancer.circuit_open()
+                while len(extracting) < max_in_flight and (circuit_open or len(backlog) < parallel_config["MAX_DESCRIPTION_BACKLOG"]):
+                    obra_dir_name = next(obras_iter, None)
+                    if obra_dir_name is None:
+                        break
+                    # Las obras reanudadas con sus etapas de CPU ya completadas pasan directamente a descripción
+                    resume_stage = flujo_obra.first_pending_stage(state, obra_dir_name)
+                    if resume_stage in CPU_STAGES:
+                        submit_cpu(obra_dir_name)
+                    else:
+                        backlog.append(obra_dir_name)
+
+                # Pasar a descripción las obras en espera mientras haya hilos libres
+                while backlog and len(describing) < parallel_config["DESCRIPTION_OBRAS"] and not circuit_open:
+                    obra_dir_name = backlog.popleft()
+                    obra_path = os.path.join(corpus_directory, obra_dir_name)
+                    describing.add(description_executor.submit(_describe_and_assemble, obra_path, output_dir, obra_dir_name))
+
+                if not extracting and not describing:
+                    if not backlog:
+                        break
+                    # Solo quedan obras esperando a que el circuito admita la petición de prueba
+                    time.sleep(balancer.circuit_retry_in())
+                    continue
+
+                timeout = balancer.circuit_retry_in() if backlog and circuit_open else None
+                done, _ = wait(set(extracting) | describing, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in extracting:
+                        obra_dir_name, future_generation = extracting.pop(future)
+                        try:
+                            _, success = future.result()
+                        except BrokenProcessPool:
+                            # Todas las obras del pool roto fallan; se reintentarán en la próxima reanudación
+                            replace_broken_executor(future_generation)
+                            logging.error(f"  FALLO CRÍTICO: La obra {obra_dir_name} se perdió al morir un proceso trabajador.")
+                            success = False
+                        except Exception as e:
+                            logging.error(f"  FALLO CRÍTICO: Error inesperado en el trabajador de la obra {obra_dir_name}: {e}")
+                            success = False
+                        if success:
+                            backlog.append(obra_dir_name)
+                        else:
+                            finish(obra_dir_name, False)
+                    else:
+                        describing.discard(future)
+                        obra_dir_name, success = future.result()
+                        if not success and not balancer.circuit_closed() and deferrals.get(obra_dir_name, 0) < parallel_config["MAX_DESCRIPTION_DEFERRALS"]:
+                            deferrals[obra_dir_name] = deferrals.get(obra_dir_name, 0) + 1
+                            logging.info(f"  Obra {obra_dir_name} aplazada por el circuito de Ollama "
+                                         f"({deferrals[obra_dir_name]}/{parallel_config['MAX_DESCRIPTION_DEFERRALS']}).")
+                            backlog.append(obra_dir_name)
+                        else:
+                            finish(obra_dir_name, success)
+    finally:
+        cpu_executor.shutdown()
+
+    merged = utils_fs.merge_worker_logs(log_dir, config.LOG_CONFIG)
+    logging.info(f"Obras completadas: {completed}. Obras fallidas: {failed}. Logs de trabajadores fusionados: {merged}.")
+    cliente_ollama.log_endpoint_stats()
+
+def main(corpus_directory: str, workers: int = config.PARALLEL_CONFIG["WORKERS"], pipelined: bool = False,
+         history_dir: str | None = None):
+    """
+    Función principal que orquesta el pipeline para un corpus estructurado. En paralelo, las
+    obras se despachan de mayor a menor coste estimado (ver order_by_cost).
+    Devuelve la ruta del directorio de trabajo creado.
     """
     output_dir = utils_fs.setup_main_output_dir(corpus_directory, config.OUTPUT_DIRS)
     utils_fs.setup_logging(os.path.join(output_dir, config.OUTPUT_DIRS["LOGS"]), config.LOG_CONFIG)
     logging.info(f"Directorio de trabajo configurado en: {output_dir}")
 
-    # ... (resto del código con logging en lugar de print)
+    # Carpetas de obra (ej. '1', '2', '11') con sus fuentes, descubiertas en un único recorrido,
+    # omitiendo las que el estado da por ensambladas
+    manifest = descubrimiento_corpus.discover_corpus(corpus_directory, output_dir)
+    state = estado_trabajos.open_state(output_dir)
+    obra_dir_names = flujo_obra.pending_obras(state, output_dir, list(manifest["obras"]))
 
+    if workers > 1 or pipelined:
+        obra_dir_names = order_by_cost(obra_dir_names, manifest, history_dir)
+        run_pipelined(corpus_directory, output_dir, obra_dir_names, workers, state, manifest)
+    else:
+        for obra_dir_name in obra_dir_names:
+            flujo_obra.process_obra(os.path.join(corpus_directory, obra_dir_name), output_dir, obra_dir_name, state,
+                                    sources=descubrimiento_corpus.obra_sources(manifest, obra_dir_name))
+        cliente_ollama.log_endpoint_stats()
+    state.close()
+    metricas.write_run_report(output_dir)
 
-    # Bucle principal: itera sobre las carpetas de obra (ej. '1', '2', '11')
-    for obra_dir_name in sorted(os.listdir(corpus_directory)):
-        obra_path = os.path.join(corpus_directory, obra_dir_name)
-        if not os.path.isdir(obra_path):
-            continue
-
-        print(f"\n{'='*60}\nProcesando Obra: {obra_dir_name}\n{'='*60}")
-
-        # Lógica de reanudación
-        final_md_path = os.path.join(output_dir, config.OUTPUT_DIRS["FINAL_MARKDOWN"], f"{obra_dir_name}.md")
-        if os.path.exists(final_md_path):
-            print(f"  RESULTADO FINAL YA EXISTE. Saltando obra {obra_dir_name}.")
-            continue
-
-        # --- Paso 1: Encontrar las mejores fuentes para la obra ---
-        sources = utils_fs.find_best_sources(obra_path)
-        if not sources:
-            print(f"  ADVERTENCIA: No se encontraron fuentes válidas para la obra {obra_dir_name}. Saltando.")
-            continue
-
-        # --- Paso 2: Extracción de Artefactos Híbridos ---
-        doc_artifact_path = procesador_documentos.extract_artifacts_from_corpus(sources, output_dir, obra_dir_name)
-        if not doc_artifact_path:
-            print(f"  FALLO CRÍTICO: No se pudieron extraer los artefactos para {obra_dir_name}. Saltando.")
-            continue
-
-        # --- Paso 3: Optimización de Imágenes ---
-        if not procesador_imagenes.optimize_images_for_doc(doc_artifact_path):
-            print(f"  FALLO CRÍTICO: No se pudieron optimizar las imágenes para {obra_dir_name}. Saltando.")
-            continue
-
-        # --- Paso 4: Generación de Descripciones ---
-        if not generador_descripciones.generate_descriptions_for_doc(doc_artifact_path):
-            print(f"  FALLO CRÍTICO: No se pudieron generar las descripciones para {obra_dir_name}. Saltando.")
-            continue
-
-        # --- Paso 5: Ensamblaje del Markdown ---
-        if not ensamblador_markdown.assemble_markdown_for_doc(doc_artifact_path, output_dir):
-            print(f"  FALLO CRÍTICO: No se pudo ensamblar el Markdown para {obra_dir_name}. Saltando.")
-            continue
-        
-        print(f"  PROCESAMIENTO COMPLETADO CON ÉXITO PARA: {obra_dir_name}")
-
-    print("\n--- PIPELINE DE CORPUS COMPLETADO ---")
+    logging.info("\n--- PIPELINE DE CORPUS COMPLETADO ---")
+    return output_dir
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Uso: python main_corpus.py <ruta_al_directorio_del_corpus>")
-        sys.exit(1)
-    
-    corpus_path = sys.argv[1]
-    main(corpus_path)
+    parser = argparse.ArgumentParser(description="Procesa un corpus estructurado por carpetas de obra.")
+    parser.add_argument("corpus_path", help="Ruta al directorio del corpus.")
+    parser.add_argument("--workers", type=int, default=config.PARALLEL_CONFIG["WORKERS"],
+                        help="Número de obras a procesar en paralelo, cada una en su propio proceso.")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Con un solo trabajador, extrae la obra siguiente en otro proceso mientras se describe la actual.")
+    parser.add_argument("--history", default=None, metavar="DIRECTORIO_TRABAJO",
+                        help="Directorio de trabajo de una ejecución anterior cuyas duraciones por obra afinan el orden de despacho.")
+    args = parser.parse_args()
+
+    main(args.corpus_path, workers=max(1, args.workers), pipelined=args.pipelined, history_dir=args.history)
@@ -0,0 +1,114 @@
+# modulos/cache_descripciones.py
+# Caché persistente de descripciones indexada por contenido de la imagen, modelo y prompt.
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import config
+
+def hash_file(path: str) -> str:
+    """Calcula el SHA-256 del contenido de un archivo leyéndolo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class DescriptionCache:
+    """
+    Tabla SQLite de descripciones. Puede compartirse entre procesos y entre directorios de
+    trabajo; usa WAL para que las lecturas no bloqueen a los escritores.
+    """
+
+    def __init__(self, path: str, max_size_bytes: int):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS descriptions (
+                image_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                description TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (image_hash, model, prompt_hash)
+            )"""
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_descriptions_last_used ON descriptions (last_used)")
+        self._connection.commit()
+
+    def get(self, image_hash: str, model: str, prompt: str) -> str | None:
+        """Devuelve la descripción almacenada o None, actualizando los contadores de aciertos/fallos."""
+        key = (image_hash, model, _hash_text(prompt))
+        row = self._connection.execute(
+            "SELECT description FROM descriptions WHERE image_hash = ? AND model = ? AND prompt_hash = ?", key
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._connection.execute(
+            "UPDATE descriptions SET last_used = ? WHERE image_hash = ? AND model = ? AND prompt_hash = ?", (time.time(), *key)
+        )
+        self._connection.commit()
+        return row[0]
+
+    def put(self, image_hash: str, model: str, prompt: str, description: str):
+        """Guarda (o reemplaza) la descripción de una imagen."""
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (image_hash, model, _hash_text(prompt), description, len(description.encode("utf-8")), now, now)
+        )
+        self._connection.commit()
+
+    def evict(self) -> int:
+        """
+        Si el tamaño de las descripciones almacenadas supera el máximo, elimina las menos
+        usadas recientemente hasta quedar en el 90% del límite. Devuelve las entradas eliminadas.
+        """
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM descriptions").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return 0
+
+        to_free = total_size - int(self.max_size_bytes * 0.9)
+        rowids = []
+        for rowid, size in self._connection.execute("SELECT rowid, size FROM descriptions ORDER BY last_used"):
+            rowids.append((rowid,))
+            to_free -= size
+            if to_free <= 0:
+                break
+        self._connection.executemany("DELETE FROM descriptions WHERE rowid = ?", rowids)
+        self._connection.commit()
+        logging.info(f"    -> Caché de descripciones: {len(rowids)} entradas antiguas eliminadas.")
+        return len(rowids)
+
+    def close(self):
+        self._connection.close()
+
+def open_cache(work_dir: str) -> DescriptionCache | None:
+    """
+    Abre la caché configurada en DESCRIPTION_CACHE_CONFIG. Por defecto vive en la raíz del
+    directorio de trabajo. Devuelve None si está deshabilitada o no se puede abrir.
+    """
+    cache_config = config.DESCRIPTION_CACHE_CONFIG
+    if not cache_config["ENABLED"]:
+        return None
+
+    cache_path = cache_config["PATH"] or os.path.join(work_dir, cache_config["FILENAME"])
+    try:
+        return DescriptionCache(cache_path, cache_config["MAX_SIZE_MB"] * 1024 * 1024)
+    except sqlite3.Error as e:
+        logging.warning(f"    No se pudo abrir la caché de descripciones en {cache_path}: {e}")
+        return None
@@ -0,0 +1,322 @@
+# modulos/cliente_ollama.py
+# Cliente HTTP para la API de chat de Ollama con sesión persistente (keep-alive),
+# reparto de carga entre varios endpoints, reintentos y circuito de protección.
+
+import time
+import random
+import base64
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import config
+
+_session = None
+_balancer = None
+_init_lock = threading.Lock()
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: Ollama acumuló fallos consecutivos y no se envían peticiones."""
+
+class Endpoint:
+    """Estado de un host de Ollama: peticiones en vuelo, expulsión temporal y estadísticas."""
+
+    def __init__(self, url: str, weight: float, max_concurrent: int):
+        self.url = url
+        self.weight = weight
+        self.max_concurrent = max_concurrent
+        self.outstanding = 0
+        self.ejected_until = 0.0
+        # Estadísticas acumuladas del proceso
+        self.requests = 0
+        self.failures = 0
+        self.latencies = []
+        self.first_request = None
+        self.last_response = None
+
+class EndpointBalancer:
+    """
+    Reparte las peticiones con la política de menos peticiones pendientes ponderada por peso.
+    Un endpoint que agota el tiempo o devuelve un 5xx queda fuera de rotación durante
+    ENDPOINT_COOLDOWN segundos.
+    También actúa como circuito: tras breaker_failures fallos transitorios consecutivos (en
+    cualquier endpoint) se abre y acquire() lanza CircuitOpenError durante breaker_cooldown
+    segundos. Un fallo no transitorio (un 4xx distinto de 429 o una respuesta no válida)
+    demuestra que el host responde y, para el circuito, cuenta como un éxito.
+    Pasado ese tiempo deja pasar una sola petición de prueba (las demás esperan su resultado):
+    si tiene éxito el circuito se cierra y, si falla, vuelve a abrirse.
+    """
+
+    def __init__(self, endpoints: list[Endpoint], cooldown: float, breaker_failures: int = 0, breaker_cooldown: float = 0.0):
+        self.endpoints = endpoints
+        self.cooldown = cooldown
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.consecutive_failures = 0
+        self.circuit_openings = 0
+        self._open_until = 0.0  # 0 = circuito cerrado
+        self._trial_in_flight = False
+        self._condition = threading.Condition()
+
+    @property
+    def max_concurrency(self) -> int:
+        return sum(endpoint.max_concurrent for endpoint in self.endpoints)
+
+    def circuit_open(self) -> bool:
+        """Indica si el circuito está abierto y aún no admite la petición de prueba."""
+        with self._condition:
+            return self._open_until > time.monotonic()
+
+    def circuit_closed(self) -> bool:
+        """Indica si el circuito está cerrado (ni abierto ni pendiente de la petición de prueba)."""
+        with self._condition:
+            return not self._open_until
+
+    def circuit_retry_in(self) -> float:
+        """Segundos que faltan para que el circuito admita la petición de prueba (0 si no está abierto)."""
+        with self._condition:
+            return max(0.0, self._open_until - time.monotonic())
+
+    def acquire(self) -> Endpoint:
+        """
+        Bloquea hasta que algún endpoint disponible tenga capacidad libre y lo reserva.
+        Lanza CircuitOpenError si el circuito está abierto.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                trial = False
+                if self._open_until:
+                    if now < self._open_until:
+                        raise CircuitOpenError(f"Circuito abierto tras {self.consecutive_failures} fallos consecutivos; "
+                                               f"se reintentará en {self._open_until - now:.0f} s.")
+                    if self._trial_in_flight:
+                        self._condition.wait()
+                        continue
+                    trial = True
+
+                candidates = [e for e in self.endpoints if e.ejected_until <= now and e.outstanding < e.max_concurrent]
+                if candidates:
+                    endpoint = min(candidates, key=lambda e: (e.outstanding + 1) / e.weight)
+                    endpoint.outstanding += 1
+                    if endpoint.first_request is None:
+                        endpoint.first_request = time.time()
+                    self._trial_in_flight = trial
+                    return endpoint
+
+                # Esperar a que se libere una petición o a que termine la expulsión más próxima
+                pending_cooldowns = [e.ejected_until - now for e in self.endpoints if e.ejected_until > now]
+                self._condition.wait(timeout=min(pending_cooldowns) if pending_cooldowns else None)
+
+    def release(self, endpoint: Endpoint, latency: float, success: bool, eject: bool = False, transient: bool = True):
+        """
+        Libera la reserva de un endpoint y registra el resultado de la petición. Solo los
+        fallos transitorios (transient=True) cuentan para abrir el circuito.
+        """
+        with self._condition:
+            endpoint.outstanding -= 1
+            endpoint.requests += 1
+            endpoint.last_response = time.time()
+            if success:
+                endpoint.latencies.append(latency)
+            else:
+                endpoint.failures += 1
+            if eject:
+                endpoint.ejected_until = time.monotonic() + self.cooldown
+                logging.warning(f"    Endpoint {endpoint.url} fuera de rotación durante {self.cooldown} s.")
+
+            if success or not transient:
+                if self._open_until:
+                    logging.info("    Circuito de Ollama cerrado: la petición de prueba obtuvo respuesta.")
+                self.consecutive_failures = 0
+                self._open_until = 0.0
+                self._trial_in_flight = False
+            else:
+                self.consecutive_failures += 1
+                # Los fallos de peticiones que ya estaban en vuelo cuando se abrió el circuito no lo rearman
+                already_open = self._open_until > time.monotonic()
+                if self.breaker_failures and (self._trial_in_flight or (not already_open and self.consecutive_failures >= self.breaker_failures)):
+                    self._open_until = time.monotonic() + self.breaker_cooldown
+                    self._trial_in_flight = False
+                    self.circuit_openings += 1
+                    logging.warning(f"    Circuito de Ollama abierto tras {self.consecutive_failures} fallos consecutivos: "
+                                    f"no se enviarán peticiones durante {self.breaker_cooldown} s.")
+            self._condition.notify_all()
+
+    def timeout_for(self, endpoint: Endpoint, attempt: int) -> float:
+        """
+        Timeout de una petición: con suficientes latencias registradas en el endpoint, su
+        percentil configurado multiplicado por TIMEOUT_MULTIPLIER, duplicado en cada
+        reintento y acotado entre MIN_TIMEOUT y REQUEST_TIMEOUT.
+        """
+        ollama_config = config.OLLAMA_CONFIG
+        max_timeout = ollama_config["REQUEST_TIMEOUT"]
+        if not ollama_config["ADAPTIVE_TIMEOUT"]:
+            return max_timeout
+        with self._condition:
+            recent = sorted(endpoint.latencies[-ollama_config["TIMEOUT_WINDOW"]:])
+        if len(recent) < ollama_config["TIMEOUT_MIN_SAMPLES"]:
+            return max_timeout
+        percentile = recent[min(len(recent) - 1, int(len(recent) * ollama_config["TIMEOUT_PERCENTILE"]))]
+        timeout = max(ollama_config["MIN_TIMEOUT"], percentile * ollama_config["TIMEOUT_MULTIPLIER"]) * 2 ** attempt
+        return min(max_timeout, timeout)
+
+def get_balancer() -> EndpointBalancer:
+    """Devuelve el balanceador del proceso, construido a partir de OLLAMA_CONFIG."""
+    global _balancer
+    with _init_lock:
+        if _balancer is None:
+            endpoint_configs = config.OLLAMA_CONFIG.get("ENDPOINTS") or [{
+                "URL": config.OLLAMA_CONFIG["API_ENDPOINT_CHAT"],
+                "MAX_CONCURRENT_REQUESTS": config.OLLAMA_CONFIG["MAX_CONCURRENT_REQUESTS"],
+            }]
+            endpoints = [
+                Endpoint(
+                    url=endpoint_config["URL"],
+                    weight=endpoint_config.get("WEIGHT", 1),
+                    max_concurrent=endpoint_config.get("MAX_CONCURRENT_REQUESTS", config.OLLAMA_CONFIG["MAX_CONCURRENT_REQUESTS"]),
+                )
+                for endpoint_config in endpoint_configs
+            ]
+            _balancer = EndpointBalancer(endpoints, config.OLLAMA_CONFIG["ENDPOINT_COOLDOWN"],
+                                         config.OLLAMA_CONFIG["BREAKER_FAILURES"], config.OLLAMA_CONFIG["BREAKER_COOLDOWN"])
+    return _balancer
+
+def get_session() -> requests.Session:
+    """
+    Devuelve la sesión HTTP compartida por todos los hilos del proceso. Su pool de
+    conexiones admite tantas conexiones por host como peticiones simultáneas se permiten,
+    de modo que cada petición reutiliza una conexión TCP abierta en lugar de crear una nueva.
+    """
+    global _session
+    balancer = get_balancer()
+    with _init_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=len(balancer.endpoints),
+                pool_maxsize=max(endpoint.max_concurrent for endpoint in balancer.endpoints),
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+def _should_eject(error: requests.exceptions.RequestException) -> bool:
+    """Un timeout, un fallo de conexión o una respuesta 5xx indican un host no sano."""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code >= 500
+
+def _is_transient(error: requests.exceptions.RequestException) -> bool:
+    """Fallos que vale la pena reintentar: timeout, conexión, 5xx y 429 (servidor saturado)."""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    return response is not None and (response.status_code >= 500 or response.status_code == 429)
+
+def _backoff_delay(attempt: int) -> float:
+    """Espera exponencial con variación aleatoria completa antes del reintento número attempt + 1."""
+    ollama_config = config.OLLAMA_CONFIG
+    return random.uniform(0, min(ollama_config["BACKOFF_MAX"], ollama_config["BACKOFF_BASE"] * 2 ** attempt))
+
+def describe_image(image_path: str, prompt: str) -> str | None:
+    """
+    Envía una imagen al endpoint de chat elegido por el balanceador y devuelve el texto
+    de la respuesta del modelo. Los fallos transitorios se reintentan hasta MAX_RETRIES
+    veces con espera exponencial aleatoria, cada vez con el timeout adaptativo del
+    endpoint elegido. Propaga FileNotFoundError, CircuitOpenError y
+    requests.exceptions.RequestException (agotados los reintentos) al llamador.
+    """
+    return describe_images([image_path], prompt)
+
+def describe_images(image_paths: list[str], prompt: str, json_format: bool = False) -> str | None:
+    """
+    Como describe_image, pero adjunta varias imágenes al mismo mensaje (en el orden de
+    image_paths). Con json_format se pide a Ollama una respuesta en JSON válido.
+    """
+    base64_images = []
+    for image_path in image_paths:
+        with open(image_path, "rb") as img_file:
+            base64_images.append(base64.b64encode(img_file.read()).decode('utf-8'))
+
+    payload = {
+        "model": config.OLLAMA_CONFIG["MODEL_NAME"],
+        "stream": False,
+        "messages": [{
+            "role": "user",
+            "content": prompt,
+            "images": base64_images
+        }]
+    }
+    if json_format:
+        payload["format"] = "json"
+
+    session = get_session()
+    balancer = get_balancer()
+    max_retries = config.OLLAMA_CONFIG["MAX_RETRIES"]
+    for attempt in range(max_retries + 1):
+        endpoint = balancer.acquire()
+        timeout = balancer.timeout_for(endpoint, attempt)
+        start = time.monotonic()
+        try:
+            response = session.post(endpoint.url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            content = response.json().get("message", {}).get("content")
+        except requests.exceptions.RequestException as e:
+            balancer.release(endpoint, time.monotonic() - start, success=False, eject=_should_eject(e), transient=_is_transient(e))
+            if _is_transient(e) and balancer.circuit_open():
+                # El fallo abrió el circuito: la imagen queda pendiente en lugar de darse por fallida
+                raise CircuitOpenError(f"Circuito abierto tras el fallo de {endpoint.url}: {e}") from e
+            if attempt == max_retries or not _is_transient(e):
+                raise
+            delay = _backoff_delay(attempt)
+            logging.warning(f"    Intento {attempt + 1} fallido en {endpoint.url} ({e}); reintentando en {delay:.1f} s.")
+            time.sleep(delay)
+            continue
+        except Exception:
+            balancer.release(endpoint, time.monotonic() - start, success=False, transient=False)
+            raise
+
+        balancer.release(endpoint, time.monotonic() - start, success=True)
+        return content
+
+def get_endpoint_stats() -> dict:
+    """Devuelve una copia serializable de las estadísticas acumuladas por endpoint en este proceso."""
+    balancer = get_balancer()
+    with balancer._condition:
+        return {
+            endpoint.url: {
+                "requests": endpoint.requests,
+                "failures": endpoint.failures,
+                "latencies": list(endpoint.latencies),
+                "first_request": endpoint.first_request,
+                "last_response": endpoint.last_response,
+            }
+            for endpoint in balancer.endpoints
+        }
+
+def log_endpoint_stats():
+    """
+    Escribe en el log el rendimiento (descripciones/minuto) y la latencia de cada endpoint.
+    Todas las peticiones a Ollama salen del proceso principal, así que sus estadísticas son las de la ejecución.
+    """
+    stats = get_endpoint_stats()
+    if not any(endpoint_stats["requests"] for endpoint_stats in stats.values()):
+        return
+
+    logging.info("--- RENDIMIENTO POR ENDPOINT DE OLLAMA ---")
+    for url, endpoint_stats in stats.items():
+        latencies = sorted(endpoint_stats["latencies"])
+        successes = len(latencies)
+        elapsed = (endpoint_stats["last_response"] or 0) - (endpoint_stats["first_request"] or 0)
+        throughput = successes / elapsed * 60 if elapsed > 0 else 0.0
+        mean_latency = sum(latencies) / successes if successes else 0.0
+        p95_latency = latencies[min(successes - 1, int(successes * 0.95))] if successes else 0.0
+        logging.info(
+            f"  {url}: {endpoint_stats['requests']} peticiones, {endpoint_stats['failures']} fallidas, "
+            f"{throughput:.1f} descripciones/min, latencia media {mean_latency:.2f} s, p95 {p95_latency:.2f} s"
+        )
+    if get_balancer().circuit_openings:
+        logging.info(f"  Circuito de Ollama abierto {get_balancer().circuit_openings} veces durante la ejecución.")
@@ -0,0 +1,169 @@
+# modulos/deduplicador_imagenes.py
+# Módulo para detectar imágenes casi duplicadas mediante hashes perceptuales.
+
+import os
+import json
+import sqlite3
+import logging
+from PIL import Image
+import config
+from modulos import diario_metadatos
+
+class BKTree:
+    """Árbol BK sobre la distancia de Hamming para buscar hashes cercanos sin recorrerlos todos."""
+
+    def __init__(self):
+        self._root = None  # Nodo: (hash, payload, {distancia: nodo_hijo})
+
+    def add(self, value: int, payload):
+        if self._root is None:
+            self._root = (value, payload, {})
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, payload, {})
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, object]]:
+        """Devuelve [(distancia, payload)] de todos los hashes a distancia <= max_distance."""
+        matches = []
+        pending = [self._root] if self._root else []
+        while pending:
+            node_value, payload, children = pending.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                matches.append((distance, payload))
+            # Desigualdad triangular: solo pueden contener coincidencias los hijos en este rango
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        return matches
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def compute_dhash(image_path: str, hash_size: int) -> int:
+    """Calcula el hash de diferencias (dHash) de una imagen: robusto a reescalado y ruido JPEG."""
+    with Image.open(image_path) as image:
+        image.draft("L", (hash_size * 4, hash_size * 4))
+        pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).getdata())
+
+    value = 0
+    for row in range(hash_size):
+        row_start = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[row_start + col] > pixels[row_start + col + 1])
+    return value
+
+# Índice del corpus cargado en este proceso; se actualiza de forma incremental desde SQLite
+_corpus_index = {"path": None, "tree": None, "last_rowid": 0}
+
+def _open_index(index_path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(index_path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS leaders (
+            obra TEXT NOT NULL,
+            image_id TEXT NOT NULL,
+            phash TEXT NOT NULL,
+            PRIMARY KEY (obra, image_id)
+        )"""
+    )
+    return connection
+
+def _refresh_corpus_index(connection: sqlite3.Connection, index_path: str) -> BKTree:
+    """Añade al árbol BK del proceso las imágenes líder registradas desde la última carga."""
+    if _corpus_index["path"] != index_path:
+        _corpus_index.update(path=index_path, tree=BKTree(), last_rowid=0)
+
+    rows = connection.execute(
+        "SELECT rowid, obra, image_id, phash FROM leaders WHERE rowid > ? ORDER BY rowid", (_corpus_index["last_rowid"],)
+    ).fetchall()
+    for rowid, obra, image_id, phash in rows:
+        _corpus_index["tree"].add(int(phash, 16), (obra, image_id))
+        _corpus_index["last_rowid"] = rowid
+    return _corpus_index["tree"]
+
+def detect_duplicates_for_doc(doc_artifact_path: str) -> bool:
+    """
+    Calcula el hash perceptual de cada imagen optimizada y marca en los metadatos como
+    seguidoras ("duplicate_of") a las que son casi idénticas a una imagen líder de la misma
+    obra o de otra obra del corpus. Las líderes se registran en el índice del corpus.
+    """
+    dedup_config = config.DEDUPLICATION_CONFIG
+    if not dedup_config["ENABLED"]:
+        return True
+
+    logging.info("  [Paso 2b] Detectando imágenes casi duplicadas...")
+    obra_name = os.path.basename(os.path.normpath(doc_artifact_path))
+    work_dir = os.path.dirname(os.path.dirname(os.path.abspath(doc_artifact_path)))
+    metadata_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"])
+    index_path = os.path.join(work_dir, dedup_config["INDEX_FILENAME"])
+    max_distance = dedup_config["MAX_DISTANCE"]
+
+    try:
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        logging.error(f"    No se pudo leer o decodificar el archivo de metadatos: {e}")
+        return False
+
+    try:
+        connection = _open_index(index_path)
+        corpus_tree = _refresh_corpus_index(connection, index_path)
+    except sqlite3.Error as e:
+        logging.error(f"    No se pudo abrir el índice de imágenes en {index_path}: {e}")
+        return False
+
+    doc_tree = BKTree()
+    leaders = []
+    followers = 0
+    for image_meta in metadata.get("images", []):
+        if not image_meta.get("optimized_path"):
+            continue
+
+        if not image_meta.get("phash"):
+            try:
+                phash = compute_dhash(os.path.join(doc_artifact_path, image_meta["optimized_path"]), dedup_config["HASH_SIZE"])
+            except Exception as e:
+                logging.warning(f"    No se pudo calcular el hash perceptual de {image_meta['id']}: {e}")
+                continue
+            image_meta["phash"] = f"{phash:016x}"
+        phash = int(image_meta["phash"], 16)
+
+        # Las imágenes ya descritas conservan su descripción y siguen sirviendo como líderes
+        match = None
+        if not image_meta.get("description"):
+            # Las entradas del índice de esta misma obra pueden ser de una extracción anterior
+            candidates = [(d, p) for d, p in corpus_tree.search(phash, max_distance) if p[0] != obra_name]
+            candidates += [(d, (obra_name, image_id)) for d, image_id in doc_tree.search(phash, max_distance)]
+            if candidates:
+                match = min(candidates, key=lambda candidate: candidate[0])
+
+        if match:
+            distance, (leader_obra, leader_id) = match
+            image_meta["duplicate_of"] = {"obra": leader_obra, "id": leader_id, "distance": distance}
+            followers += 1
+        else:
+            image_meta.pop("duplicate_of", None)
+            doc_tree.add(phash, image_meta["id"])
+            leaders.append((obra_name, image_meta["id"], image_meta["phash"]))
+
+    try:
+        with connection:
+            connection.execute("DELETE FROM leaders WHERE obra = ?", (obra_name,))
+            connection.executemany("INSERT INTO leaders VALUES (?, ?, ?)", leaders)
+    except sqlite3.Error as e:
+        logging.warning(f"    No se pudo actualizar el índice de imágenes: {e}")
+    finally:
+        connection.close()
+
+    diario_metadatos.write_metadata(metadata_path, metadata)
+
+    logging.info(f"    -> {followers} imágenes casi duplicadas reutilizarán la descripción de su líder.")
+    logging.info("  [Paso 2b] Detección de duplicados completada.")
+    return True
@@ -0,0 +1,110 @@
+# modulos/descubrimiento_corpus.py
+# Descubrimiento del corpus: un único recorrido paralelo que produce el manifiesto de fuentes.
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import config
+from modulos import utils_fs
+
+def _scan_obra(obra_path: str) -> dict | None:
+    try:
+        return utils_fs.scan_obra_sources(obra_path)
+    except OSError as e:
+        logging.warning(f"  ADVERTENCIA: No se pudo recorrer la obra {os.path.basename(obra_path)}: {e}")
+        return None
+
+def _list_obra_entries(corpus_dir: str) -> list:
+    with os.scandir(corpus_dir) as it:
+        return sorted((entry for entry in it if entry.is_dir()), key=lambda entry: entry.name)
+
+def _save_manifest(manifest: dict, work_dir: str) -> str:
+    manifest_path = os.path.join(work_dir, config.DISCOVERY_CONFIG["MANIFEST_FILENAME"])
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+    return manifest_path
+
+def discover_corpus(corpus_dir: str, work_dir: str, workers: int | None = None) -> dict:
+    """
+    Recorre el corpus una sola vez, con las obras repartidas en un pool de hilos (las
+    llamadas a os.scandir y stat liberan el GIL y se solapan en sistemas de archivos de red),
+    y guarda el manifiesto en la raíz del directorio de trabajo. El manifiesto asocia cada
+    obra con sus fuentes elegidas de texto e imágenes y el tamaño y fecha de cada archivo;
+    las obras sin fuentes válidas quedan con valor None.
+    """
+    discovery_config = config.DISCOVERY_CONFIG
+    start = time.monotonic()
+    obra_entries = _list_obra_entries(corpus_dir)
+
+    with ThreadPoolExecutor(max_workers=workers or discovery_config["WORKERS"]) as executor:
+        scans = executor.map(_scan_obra, [entry.path for entry in obra_entries])
+        obras = {entry.name: scan for entry, scan in zip(obra_entries, scans)}
+
+    manifest = {"corpus_dir": os.path.abspath(corpus_dir), "created": time.time(), "obras": obras}
+    manifest_path = _save_manifest(manifest, work_dir)
+
+    logging.info(f"Corpus descubierto: {len(obras)} obras ({sum(1 for scan in obras.values() if scan is None)} sin fuentes válidas) "
+                 f"en {time.monotonic() - start:.1f} s. Manifiesto: {manifest_path}")
+    return manifest
+
+def load_manifest(work_dir: str) -> dict | None:
+    """Lee el manifiesto del directorio de trabajo; devuelve None si no existe o está dañado."""
+    try:
+        with open(os.path.join(work_dir, config.DISCOVERY_CONFIG["MANIFEST_FILENAME"]), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def get_manifest(corpus_dir: str, work_dir: str, rescan: bool = False) -> dict:
+    """
+    Devuelve el manifiesto del directorio de trabajo, recorriendo el corpus solo si no existe,
+    si pertenece a otro corpus o si se pide explícitamente con rescan. Al reutilizarlo, lista
+    las carpetas de obra del corpus (un único os.scandir) y recorre solo las que el manifiesto
+    no conoce, para que las obras añadidas después de crearlo no se omitan.
+    """
+    manifest = None if rescan else load_manifest(work_dir)
+    if manifest is None or manifest.get("corpus_dir") != os.path.abspath(corpus_dir):
+        return discover_corpus(corpus_dir, work_dir)
+
+    new_entries = [entry for entry in _list_obra_entries(corpus_dir) if entry.name not in manifest["obras"]]
+    if new_entries:
+        logging.info(f"El corpus tiene {len(new_entries)} obras que no están en el manifiesto; recorriéndolas...")
+        with ThreadPoolExecutor(max_workers=config.DISCOVERY_CONFIG["WORKERS"]) as executor:
+            scans = executor.map(_scan_obra, [entry.path for entry in new_entries])
+            manifest["obras"].update({entry.name: scan for entry, scan in zip(new_entries, scans)})
+        manifest["obras"] = dict(sorted(manifest["obras"].items()))
+        _save_manifest(manifest, work_dir)
+    logging.info(f"Usando el manifiesto de fuentes existente ({len(manifest['obras'])} obras).")
+    return manifest
+
+def source_bytes(manifest: dict, obra_name: str) -> int:
+    """Tamaño total de los archivos fuente de una obra según el manifiesto (0 si no tiene fuentes)."""
+    scan = manifest["obras"].get(obra_name)
+    if not scan:
+        return 0
+    return sum(entry["size"] for entry in scan["files"].values())
+
+def estimate_costs(manifest: dict, obra_names: list[str], durations: dict[str, float] | None = None) -> dict[str, float]:
+    """
+    Coste estimado de cada obra en segundos. Se usa la duración registrada en ejecuciones
+    anteriores cuando existe; para las demás, el tamaño de sus fuentes multiplicado por los
+    segundos por byte observados en las obras con duración registrada. Sin ninguna duración,
+    el coste es simplemente el tamaño en bytes, que basta para ordenar.
+    """
+    durations = durations or {}
+    sizes = {name: source_bytes(manifest, name) for name in obra_names}
+    timed = [name for name in obra_names if name in durations and sizes[name]]
+    timed_bytes = sum(sizes[name] for name in timed)
+    seconds_per_byte = sum(durations[name] for name in timed) / timed_bytes if timed_bytes else 1.0
+    return {name: durations[name] if name in durations else sizes[name] * seconds_per_byte for name in obra_names}
+
+def obra_sources(manifest: dict, obra_name: str) -> dict | None:
+    """Fuentes de una obra en el formato de utils_fs.find_best_sources, o None."""
+    scan = manifest["obras"].get(obra_name)
+    if not scan:
+        return None
+    return {"text": scan["text"], "image": scan["image"]}
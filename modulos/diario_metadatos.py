@@ -0,0 +1,85 @@
+# modulos/diario_metadatos.py
+# Escritura de metadatos.json: guardado atómico y diario de cambios por imagen.
+
+import os
+import json
+import logging
+import config
+
+def write_metadata(metadata_path: str, metadata: dict):
+    """Escribe los metadatos en un archivo temporal y lo renombra, para no dejarlos a medias."""
+    temp_path = metadata_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(temp_path, metadata_path)
+
+def _journal_path(doc_artifact_path: str) -> str:
+    return os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA_JOURNAL"])
+
+def _read_journal(journal_path: str) -> list[dict]:
+    """Lee las entradas del diario. Una última línea incompleta (caída a mitad de escritura) se ignora."""
+    entries = []
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    except FileNotFoundError:
+        pass
+    return entries
+
+def _apply_entries(metadata: dict, entries: list[dict]):
+    images_by_id = {img["id"]: img for img in metadata.get("images", [])}
+    for entry in entries:
+        image = images_by_id.get(entry["id"])
+        if image is not None:
+            image.update(entry["set"])
+
+def load_metadata(doc_artifact_path: str) -> dict:
+    """
+    Lee metadatos.json con los cambios del diario aún no compactados ya aplicados.
+    Propaga FileNotFoundError y json.JSONDecodeError al llamador.
+    """
+    with open(os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"]), "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    _apply_entries(metadata, _read_journal(_journal_path(doc_artifact_path)))
+    return metadata
+
+def compact(doc_artifact_path: str) -> bool:
+    """
+    Aplica el diario pendiente sobre metadatos.json con escritura atómica y lo elimina.
+    Se llama al terminar la etapa y, al empezarla, para recuperar el diario de una ejecución
+    interrumpida.
+    """
+    journal_path = _journal_path(doc_artifact_path)
+    if not os.path.exists(journal_path):
+        return True
+    try:
+        metadata = load_metadata(doc_artifact_path)
+        write_metadata(os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"]), metadata)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"    No se pudo compactar el diario de metadatos: {e}")
+        return False
+    os.remove(journal_path)
+    return True
+
+class MetadataJournal:
+    """
+    Diario de cambios por imagen (JSON Lines) para guardados incrementales en O(1): cada
+    cambio se añade como una línea y se vuelca al disco en el acto, sin reescribir
+    metadatos.json. compact() lo integra en metadatos.json al final de la etapa.
+    Solo debe haber un escritor por obra.
+    """
+
+    def __init__(self, doc_artifact_path: str):
+        self.doc_artifact_path = doc_artifact_path
+        self._file = open(_journal_path(doc_artifact_path), "a", encoding="utf-8")
+
+    def update_image(self, image_id: str, **fields):
+        self._file.write(json.dumps({"id": image_id, "set": fields}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
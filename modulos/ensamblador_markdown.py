@@ -3,60 +3,131 @@
 
 import os
 import json
+import hashlib
 import config
 
+IMAGE_PLACEHOLDER = "<!-- image -->"
+
+def _image_markdown(image_meta: dict, doc_basename: str) -> str:
+    """Devuelve el Markdown que sustituye al placeholder de una imagen."""
+    # La ruta en el markdown debe ser relativa al propio markdown
+    # Ej: ../02_artefactos_extraidos/documento/imagenes_originales/img_01.png
+    relative_image_path = os.path.join(
+        "..",
+        config.OUTPUT_DIRS["ARTIFACTS"],
+        doc_basename,
+        image_meta["original_path"]
+    )
+
+    if image_meta.get("skipped"):
+        # Imagen trivial: se elimina el placeholder o se enlaza sin descripción
+        if config.ASSEMBLY_CONFIG["SKIPPED_IMAGES"] == "stub":
+            return f"\n![Imagen omitida: {image_meta.get('skip_reason', '')}]({relative_image_path})\n"
+        return ""
+
+    description = image_meta.get("description") or "Descripción no disponible."
+    model_name = config.OLLAMA_CONFIG["MODEL_NAME"]
+    return (
+        f"\n![{description[:100]}]({relative_image_path})\n"
+        f"> **Descripción ({model_name}):** {description}\n"
+    )
+
+def _markdown_chunks(base_markdown: str, images_metadata: list[dict], doc_basename: str):
+    """
+    Divide el texto una sola vez por los placeholders y genera, en orden, los fragmentos de
+    texto intercalados con el Markdown de cada imagen. Los placeholders sin imagen
+    correspondiente se conservan tal cual.
+    """
+    segments = base_markdown.split(IMAGE_PLACEHOLDER)
+    yield segments[0]
+    for index, segment in enumerate(segments[1:]):
+        if index < len(images_metadata):
+            yield _image_markdown(images_metadata[index], doc_basename)
+        else:
+            yield IMAGE_PLACEHOLDER
+        yield segment
+
+def _load_inputs(doc_artifact_path: str) -> tuple[dict, str]:
+    """Lee los metadatos y el texto extraído de una obra. Propaga FileNotFoundError."""
+    with open(os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"]), "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    with open(os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["TEXT"]), "r", encoding="utf-8") as f:
+        base_markdown = f.read()
+    return metadata, base_markdown
+
+def _write_chunks(final_md_path: str, chunks):
+    """Escribe los fragmentos en un archivo temporal que sustituye al final al terminar."""
+    temp_md_path = final_md_path + ".tmp"
+    with open(temp_md_path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(temp_md_path, final_md_path)
+
+def _file_sha256(path: str) -> str | None:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
 def assemble_markdown_for_doc(doc_artifact_path: str, output_dir: str):
     """
     Ensambla el archivo Markdown final a partir de los artefactos generados.
     """
     print("  [Paso 4] Ensamblando el archivo Markdown final...")
     doc_basename = os.path.basename(doc_artifact_path)
-    metadata_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"])
-    text_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["TEXT"])
     final_md_path = os.path.join(output_dir, config.OUTPUT_DIRS["FINAL_MARKDOWN"], f"{doc_basename}.md")
 
     try:
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-        
-        with open(text_path, "r", encoding="utf-8") as f:
-            base_markdown = f.read()
-
+        metadata, base_markdown = _load_inputs(doc_artifact_path)
     except FileNotFoundError as e:
         print(f"    ERROR: No se encontró un archivo necesario ({e.filename}). No se puede ensamblar el Markdown.")
         return False
 
-    final_markdown = base_markdown
     images_metadata = metadata.get("images", [])
+    placeholder_count = base_markdown.count(IMAGE_PLACEHOLDER)
 
-    for image_meta in images_metadata:
-        # La ruta en el markdown debe ser relativa al propio markdown
-        # Ej: ../02_artefactos_extraidos/documento/imagenes_originales/img_01.png
-        relative_image_path = os.path.join(
-            "..",
-            config.OUTPUT_DIRS["ARTIFACTS"],
-            doc_basename,
-            image_meta["original_path"]
-        )
-
-        description = image_meta.get("description", "Descripción no disponible.")
-        model_name = config.OLLAMA_CONFIG["MODEL_NAME"]
-
-        replacement_text = (
-            f"\n![{description[:100]}]({relative_image_path})\n"
-            f"> **Descripción ({model_name}):** {description}\n"
-        )
-
-        # Reemplazar el primer placeholder disponible
-        final_markdown = final_markdown.replace("<!-- image -->", replacement_text, 1)
-
+    # Una sola pasada: los fragmentos de texto y los reemplazos se escriben intercalados, en orden
     try:
-        with open(final_md_path, "w", encoding="utf-8") as f:
-            f.write(final_markdown)
+        _write_chunks(final_md_path, _markdown_chunks(base_markdown, images_metadata, doc_basename))
         print(f"    -> Archivo final guardado en: {final_md_path}")
     except IOError as e:
         print(f"    ERROR: No se pudo escribir el archivo Markdown final. Razón: {e}")
         return False
 
+    if placeholder_count > len(images_metadata):
+        print(f"    ADVERTENCIA: {placeholder_count - len(images_metadata)} placeholders de imagen sin imagen correspondiente.")
+    elif placeholder_count < len(images_metadata):
+        print(f"    ADVERTENCIA: {len(images_metadata) - placeholder_count} imágenes sin placeholder en el texto (no se incluyen).")
+
     print("  [Paso 4] Ensamblaje completado.")
     return True
+
+def reassemble_if_changed(doc_artifact_path: str, output_dir: str) -> tuple[str, str | None]:
+    """
+    Calcula el Markdown que produciría el ensamblaje y solo reescribe el archivo final si su
+    hash difiere del existente. Pensada para reensamblar corpus completos, no escribe en la
+    consola. Devuelve ('written' | 'unchanged' | 'error', motivo del error).
+    """
+    doc_basename = os.path.basename(doc_artifact_path)
+    final_md_path = os.path.join(output_dir, config.OUTPUT_DIRS["FINAL_MARKDOWN"], f"{doc_basename}.md")
+    try:
+        metadata, base_markdown = _load_inputs(doc_artifact_path)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        return "error", str(e)
+
+    chunks = list(_markdown_chunks(base_markdown, metadata.get("images", []), doc_basename))
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+    if digest.hexdigest() == _file_sha256(final_md_path):
+        return "unchanged", None
+
+    try:
+        _write_chunks(final_md_path, chunks)
+    except OSError as e:
+        return "error", str(e)
+    return "written", None
@@ -0,0 +1,147 @@
+# modulos/estado_trabajos.py
+# Registro persistente del estado de cada obra y etapa en el directorio de trabajo.
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import config
+
+# Etapas del pipeline por obra, en orden de ejecución
+STAGES = ["sources", "extracted", "optimized", "deduplicated", "described", "assembled"]
+
+def fingerprint_files(paths: list[str]) -> str:
+    """Huella de un conjunto de archivos a partir de su ruta, tamaño y fecha de modificación."""
+    entries = []
+    for path in sorted(set(paths)):
+        try:
+            stat = os.stat(path)
+            entries.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            entries.append([path, None, None])
+    return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+
+class JobState:
+    """
+    Tabla SQLite con una fila por (obra, etapa): estado ('running', 'done', 'failed', 'pending'),
+    detalle, progreso N/M, huella de las entradas y tiempos. Permite reanudar cada obra en
+    la etapa exacta en que se detuvo y consultar el avance de todo el corpus sin recorrer
+    directorios.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS stages (
+                obra TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                detail TEXT,
+                progress INTEGER,
+                total INTEGER,
+                fingerprint TEXT,
+                started REAL,
+                finished REAL,
+                duration REAL,
+                PRIMARY KEY (obra, stage)
+            )"""
+        )
+        self._connection.commit()
+
+    def start(self, obra: str, stage: str):
+        """Marca el inicio de una etapa."""
+        with self._connection:
+            self._connection.execute(
+                """INSERT INTO stages (obra, stage, status, started) VALUES (?, ?, 'running', ?)
+                   ON CONFLICT (obra, stage) DO UPDATE SET status = 'running', detail = NULL, started = excluded.started,
+                   finished = NULL, duration = NULL""",
+                (obra, stage, time.time())
+            )
+
+    def finish(self, obra: str, stage: str, success: bool, detail: str | None = None,
+               progress: int | None = None, total: int | None = None, fingerprint: str | None = None):
+        """Marca el final de una etapa como 'done' o 'failed', con su duración."""
+        now = time.time()
+        with self._connection:
+            self._connection.execute(
+                """INSERT INTO stages (obra, stage, status, detail, progress, total, fingerprint, started, finished, duration)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+                   ON CONFLICT (obra, stage) DO UPDATE SET status = excluded.status, detail = excluded.detail,
+                   progress = excluded.progress, total = excluded.total,
+                   fingerprint = COALESCE(excluded.fingerprint, stages.fingerprint),
+                   finished = excluded.finished, duration = excluded.finished - COALESCE(stages.started, excluded.finished)""",
+                (obra, stage, "done" if success else "failed", detail, progress, total, fingerprint, now, now)
+            )
+
+    def get(self, obra: str, stage: str) -> dict | None:
+        """Devuelve la fila de una etapa como diccionario, o None si nunca se ejecutó."""
+        cursor = self._connection.execute("SELECT * FROM stages WHERE obra = ? AND stage = ?", (obra, stage))
+        row = cursor.fetchone()
+        return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def is_done(self, obra: str, stage: str) -> bool:
+        row = self.get(obra, stage)
+        return bool(row) and row["status"] == "done"
+
+    def completed_obras(self) -> set[str]:
+        """Obras cuyo Markdown final ya se ensambló."""
+        rows = self._connection.execute("SELECT obra FROM stages WHERE stage = 'assembled' AND status = 'done'")
+        return {row[0] for row in rows}
+
+    def known_obras(self) -> set[str]:
+        """Obras con alguna etapa registrada."""
+        return {row[0] for row in self._connection.execute("SELECT DISTINCT obra FROM stages")}
+
+    def durations(self, stages: list[str]) -> dict[str, float]:
+        """Segundos registrados por obra en las etapas indicadas (completadas o marcadas de nuevo como pendientes)."""
+        rows = self._connection.execute(
+            f"""SELECT obra, SUM(duration) FROM stages WHERE duration IS NOT NULL AND status IN ('done', 'pending')
+                AND stage IN ({', '.join('?' * len(stages))}) GROUP BY obra""",
+            stages
+        )
+        return {obra: total for obra, total in rows}
+
+    def reset(self, obra: str, from_stage: str, detail: str | None = None):
+        """Marca como 'pending' una etapa y todas las posteriores, para que se vuelvan a ejecutar."""
+        stages = STAGES[STAGES.index(from_stage):]
+        with self._connection:
+            self._connection.execute(
+                f"UPDATE stages SET status = 'pending', detail = ? WHERE obra = ? AND stage IN ({', '.join('?' * len(stages))})",
+                (detail, obra, *stages)
+            )
+
+    def report(self) -> dict:
+        """
+        Resumen del corpus: {etapa: {estado: número de obras}}, la etapa alcanzada por cada
+        obra incompleta y las obras con alguna etapa fallida.
+        """
+        rows = self._connection.execute("SELECT obra, stage, status, detail FROM stages").fetchall()
+        counts = {stage: {} for stage in STAGES}
+        stages_by_obra = {}
+        failed = {}
+        for obra, stage, status, detail in rows:
+            counts.setdefault(stage, {})
+            counts[stage][status] = counts[stage].get(status, 0) + 1
+            stages_by_obra.setdefault(obra, {})[stage] = status
+            if status == "failed":
+                failed[obra] = f"{stage}: {detail or ''}".strip()
+
+        pending_stage = {}
+        for obra, obra_stages in stages_by_obra.items():
+            if obra_stages.get("assembled") == "done":
+                continue
+            for stage in STAGES:
+                if obra_stages.get(stage) != "done":
+                    pending_stage[obra] = stage
+                    break
+        return {"obras": len(stages_by_obra), "stages": counts, "pending_stage": pending_stage, "failed": failed}
+
+    def close(self):
+        self._connection.close()
+
+def open_state(work_dir: str) -> JobState:
+    """Abre (o crea) la base de estado en la raíz del directorio de trabajo."""
+    return JobState(os.path.join(work_dir, config.JOB_STATE_CONFIG["FILENAME"]))
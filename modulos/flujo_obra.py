@@ -0,0 +1,213 @@
+# modulos/flujo_obra.py
+# Cadena de etapas de una obra, reanudable a partir del estado persistente.
+
+import os
+import json
+import logging
+import config
+from modulos import utils_fs, procesador_documentos, procesador_imagenes, deduplicador_imagenes, generador_descripciones, ensamblador_markdown, metricas
+from modulos.estado_trabajos import JobState, STAGES, fingerprint_files
+
+def _count_descriptions(doc_artifact_path: str) -> tuple[int, int]:
+    """Devuelve (descritas, a describir) según los metadatos de la obra."""
+    metadata_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"])
+    try:
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0, 0
+    to_describe = [img for img in metadata.get("images", []) if img.get("optimized_path") and not img.get("skipped")]
+    described = [img for img in to_describe if generador_descripciones.has_description(img)]
+    return len(described), len(to_describe)
+
+def _image_count(doc_artifact_path: str) -> int | None:
+    """Número de imágenes registradas en los metadatos de la obra, para las métricas."""
+    try:
+        with open(os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"]), "r", encoding="utf-8") as f:
+            return len(json.load(f).get("images", []))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def first_pending_stage(state: JobState, obra_name: str) -> str | None:
+    """Primera etapa de la obra que no consta como completada, o None si todas lo están."""
+    for stage in STAGES:
+        if not state.is_done(obra_name, stage):
+            return stage
+    return None
+
+def _save_fingerprints(doc_artifact_path: str, sources: dict, previous: dict | None = None) -> dict:
+    fingerprints = utils_fs.fingerprint_sources(sources, previous, config.JOB_STATE_CONFIG["FINGERPRINT_CONTENT_HASH"])
+    utils_fs.save_source_fingerprints(os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["SOURCE_FINGERPRINTS"]), fingerprints)
+    return fingerprints
+
+def apply_source_changes(obra_path: str, work_dir: str, obra_name: str, state: JobState, sources: dict | None = None) -> bool:
+    """
+    Modo incremental: compara las fuentes actuales de una obra ya extraída con las huellas
+    guardadas en su directorio de artefactos y marca como pendientes solo las etapas
+    afectadas. Un cambio en las fuentes de imágenes repite la cadena completa; un cambio
+    solo en las de texto regenera el texto aquí y deja pendiente únicamente el ensamblaje.
+    Devuelve True si la obra tenía cambios.
+    """
+    if not state.is_done(obra_name, "extracted"):
+        return False  # La reanudación normal ya la extraerá desde el principio
+
+    doc_artifact_path = os.path.join(work_dir, config.OUTPUT_DIRS["ARTIFACTS"], obra_name)
+    fingerprints_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["SOURCE_FINGERPRINTS"])
+    sources = sources or utils_fs.find_best_sources(obra_path)
+    if not sources:
+        logging.warning(f"  ADVERTENCIA: La obra {obra_name} ya no tiene fuentes válidas. Se conservan sus resultados.")
+        return False
+
+    previous = utils_fs.load_source_fingerprints(fingerprints_path)
+    if previous is None:
+        # Obras extraídas antes del modo incremental: las fuentes actuales pasan a ser la referencia
+        _save_fingerprints(doc_artifact_path, sources)
+        logging.info(f"  Obra {obra_name}: sin huellas previas; se registran las fuentes actuales como referencia.")
+        return False
+
+    current = utils_fs.fingerprint_sources(sources, previous, config.JOB_STATE_CONFIG["FINGERPRINT_CONTENT_HASH"])
+    changed = utils_fs.changed_source_kinds(previous, current)
+    if not changed:
+        return False
+
+    if "image" in changed:
+        logging.info(f"  Obra {obra_name}: cambiaron las fuentes de imágenes. Se repetirá la cadena completa.")
+        state.reset(obra_name, "sources", detail="Fuentes de imágenes modificadas")
+        return True
+
+    logging.info(f"  Obra {obra_name}: cambiaron solo las fuentes de texto. Regenerando el texto...")
+    state.finish(obra_name, "sources", True, detail=json.dumps(sources, ensure_ascii=False),
+                 fingerprint=fingerprint_files(sources["text"] + sources["image"]))
+    state.start(obra_name, "extracted")
+    if not procesador_documentos.regenerate_text_artifact(sources, doc_artifact_path):
+        # La reanudación repetirá la extracción completa
+        state.finish(obra_name, "extracted", False, detail="Fallo al regenerar el texto")
+        return True
+    state.finish(obra_name, "extracted", True, detail="Texto regenerado")
+    utils_fs.save_source_fingerprints(fingerprints_path, current)
+    state.reset(obra_name, "assembled", detail="Fuentes de texto modificadas")
+    return True
+
+def pending_obras(state: JobState, work_dir: str, obra_names: list[str]) -> list[str]:
+    """
+    Filtra las obras cuyo Markdown final consta como ensamblado en el estado. Las obras de
+    directorios de trabajo anteriores al registro de estado que ya tienen su Markdown final
+    se registran como ensambladas la primera vez que se encuentran.
+    """
+    completed = state.completed_obras()
+    known = state.known_obras()
+    pending = []
+    for obra_name in obra_names:
+        if obra_name not in completed and obra_name not in known:
+            final_md_path = os.path.join(work_dir, config.OUTPUT_DIRS["FINAL_MARKDOWN"], f"{obra_name}.md")
+            if os.path.exists(final_md_path):
+                state.finish(obra_name, "assembled", True, detail="Markdown final existente")
+                completed.add(obra_name)
+        if obra_name in completed:
+            logging.info(f"  RESULTADO FINAL YA EXISTE. Saltando obra {obra_name}.")
+            continue
+        pending.append(obra_name)
+    return pending
+
+def process_obra(obra_path: str, work_dir: str, obra_name: str, state: JobState, sources: dict | None = None,
+                 last_stage: str = STAGES[-1]) -> bool:
+    """
+    Ejecuta la cadena (fuentes → extracción → optimización → duplicados → descripción →
+    ensamblaje) para una sola obra, empezando en la primera etapa que no consta como
+    completada en el estado y registrando el resultado y la duración de cada etapa.
+    Con last_stage se detiene tras esa etapa, para que un planificador reparta las etapas
+    de una misma obra entre distintos grupos de trabajadores.
+    Devuelve True si todas las etapas hasta last_stage quedaron completadas.
+    """
+    logging.info(f"\n{'='*60}\nProcesando Obra: {obra_name}\n{'='*60}")
+
+    resume_stage = first_pending_stage(state, obra_name)
+    if resume_stage is None or state.is_done(obra_name, "assembled"):
+        logging.info(f"  RESULTADO FINAL YA EXISTE. Saltando obra {obra_name}.")
+        return True
+    if resume_stage != STAGES[0]:
+        logging.info(f"  Reanudando la obra {obra_name} en la etapa '{resume_stage}'.")
+
+    # Una vez que se ejecuta una etapa, todas las posteriores se vuelven a ejecutar
+    pending = STAGES[STAGES.index(resume_stage):STAGES.index(last_stage) + 1]
+    if not pending:
+        return True
+    doc_artifact_path = os.path.join(work_dir, config.OUTPUT_DIRS["ARTIFACTS"], obra_name)
+
+    # --- Paso 1: Encontrar las mejores fuentes para la obra ---
+    if "sources" in pending:
+        state.start(obra_name, "sources")
+        sources = sources or utils_fs.find_best_sources(obra_path)
+        if not sources:
+            state.finish(obra_name, "sources", False, detail="Sin fuentes válidas")
+            logging.warning(f"  ADVERTENCIA: No se encontraron fuentes válidas para la obra {obra_name}. Saltando.")
+            return False
+        state.finish(obra_name, "sources", True, detail=json.dumps(sources, ensure_ascii=False),
+                     fingerprint=fingerprint_files(sources["text"] + sources["image"]))
+
+    # --- Paso 2: Extracción de Artefactos Híbridos ---
+    if "extracted" in pending:
+        if sources is None:
+            sources = json.loads(state.get(obra_name, "sources")["detail"])
+        state.start(obra_name, "extracted")
+        with metricas.measure(work_dir, obra_name, "extracted") as record:
+            doc_artifact_path = procesador_documentos.extract_artifacts_from_corpus(sources, work_dir, obra_name)
+            record["success"] = bool(doc_artifact_path)
+            record["images"] = _image_count(doc_artifact_path) if doc_artifact_path else None
+        if not doc_artifact_path:
+            state.finish(obra_name, "extracted", False)
+            logging.error(f"  FALLO CRÍTICO: No se pudieron extraer los artefactos para {obra_name}. Saltando.")
+            return False
+        state.finish(obra_name, "extracted", True)
+        _save_fingerprints(doc_artifact_path, sources)
+
+    # --- Paso 3: Optimización de Imágenes ---
+    if "optimized" in pending:
+        state.start(obra_name, "optimized")
+        with metricas.measure(work_dir, obra_name, "optimized") as record:
+            record["success"] = bool(procesador_imagenes.optimize_images_for_doc(doc_artifact_path))
+            record["images"] = _image_count(doc_artifact_path)
+        if not record["success"]:
+            state.finish(obra_name, "optimized", False)
+            logging.error(f"  FALLO CRÍTICO: No se pudieron optimizar las imágenes para {obra_name}. Saltando.")
+            return False
+        state.finish(obra_name, "optimized", True)
+
+    # --- Paso 3b: Detección de Imágenes Casi Duplicadas ---
+    if "deduplicated" in pending:
+        state.start(obra_name, "deduplicated")
+        with metricas.measure(work_dir, obra_name, "deduplicated") as record:
+            deduplicated = deduplicador_imagenes.detect_duplicates_for_doc(doc_artifact_path)
+            record["success"] = bool(deduplicated)
+            record["images"] = _image_count(doc_artifact_path)
+        state.finish(obra_name, "deduplicated", deduplicated)
+        if not deduplicated:
+            logging.warning(f"  ADVERTENCIA: No se pudo completar la detección de duplicados para {obra_name}. Se describirán todas las imágenes.")
+
+    # --- Paso 4: Generación de Descripciones ---
+    if "described" in pending:
+        state.start(obra_name, "described")
+        with metricas.measure(work_dir, obra_name, "described") as record:
+            described = generador_descripciones.generate_descriptions_for_doc(doc_artifact_path, latencies=record["model_latencies"])
+            progress, total = _count_descriptions(doc_artifact_path)
+            record["success"] = bool(described)
+            record["images"] = progress
+        state.finish(obra_name, "described", described, detail=f"{progress}/{total}", progress=progress, total=total)
+        if not described:
+            logging.error(f"  FALLO CRÍTICO: No se pudieron generar las descripciones para {obra_name}. Saltando.")
+            return False
+
+    # --- Paso 5: Ensamblaje del Markdown ---
+    if "assembled" in pending:
+        state.start(obra_name, "assembled")
+        with metricas.measure(work_dir, obra_name, "assembled") as record:
+            record["success"] = bool(ensamblador_markdown.assemble_markdown_for_doc(doc_artifact_path, work_dir))
+            record["images"] = _image_count(doc_artifact_path)
+        if not record["success"]:
+            state.finish(obra_name, "assembled", False)
+            logging.error(f"  FALLO CRÍTICO: No se pudo ensamblar el Markdown para {obra_name}. Saltando.")
+            return False
+        state.finish(obra_name, "assembled", True)
+        logging.info(f"  PROCESAMIENTO COMPLETADO CON ÉXITO PARA: {obra_name}")
+
+    return True
@@ -2,103 +2,337 @@
 # Módulo para generar descripciones de imágenes usando Ollama.
 
 import os
+import re
 import json
-import base64
+import time
 import requests
 import config
 import logging
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from modulos import cliente_ollama, cache_descripciones, diario_metadatos
 
-def generate_descriptions_for_doc(doc_artifact_path: str, force_retry: bool = False):
+def _describe_image(doc_artifact_path: str, image_meta: dict, latencies: list | None = None) -> tuple[str | None, str | None]:
+    """
+    Obtiene la descripción de una imagen optimizada. Se ejecuta en un hilo del pool.
+    Devuelve (descripción, None) si el modelo respondió con una descripción válida o
+    (None, error) si falló; el error queda registrado en description_error. Propaga
+    CircuitOpenError: la imagen no se ha intentado y debe quedar pendiente.
+    Si se pasa latencies, añade la duración de cada respuesta del modelo.
+    """
+    optimized_full_path = os.path.join(doc_artifact_path, image_meta["optimized_path"])
+    try:
+        start = time.monotonic()
+        description = cliente_ollama.describe_image(optimized_full_path, config.PROMPTS["DESCRIBE_IMAGE_ES"])
+        if latencies is not None:
+            latencies.append(time.monotonic() - start)
+
+        if description and "no puedo ver la imagen" not in description.lower():
+            logging.info(f"      -> ÉXITO para {image_meta['id']}")
+            return description.strip(), None
+        error = "No se pudo generar una descripción válida."
+        logging.warning(f"      -> FALLO para {image_meta['id']}: Descripción no válida.")
+
+    except cliente_ollama.CircuitOpenError:
+        raise
+    except FileNotFoundError:
+        error = f"Archivo de imagen no encontrado en {optimized_full_path}"
+        logging.error(f"    Error: {error}")
+    except requests.exceptions.RequestException as e:
+        error = f"Error de API: {e}"
+        logging.error(f"    Error de API para {image_meta['id']}: {e}")
+    except Exception as e:
+        error = f"Error inesperado: {e}"
+        logging.error(f"    Error inesperado para {image_meta['id']}: {e}")
+
+    return None, error
+
+def _is_small_figure(doc_artifact_path: str, image_meta: dict) -> bool:
+    """Indica si la imagen optimizada es lo bastante pequeña para describirse en un lote (solo lee la cabecera)."""
+    try:
+        with Image.open(os.path.join(doc_artifact_path, image_meta["optimized_path"])) as image:
+            return max(image.size) <= config.DESCRIPTION_BATCH_CONFIG["MAX_SIDE_PX"]
+    except OSError:
+        return False
+
+def _parse_batch_response(response: str | None, count: int) -> list[str] | None:
+    """
+    Extrae las count descripciones de la respuesta a un lote: el JSON que pide el prompt
+    ({"descripciones": [...]} o directamente una lista, con objetos o cadenas) o, si el
+    modelo no respetó el formato, una lista numerada ("1. ...", "Imagen 2: ..."). Devuelve
+    None si falta alguna o alguna no es válida.
+    """
+    if not response:
+        return None
+    descriptions = None
+    start = min((i for i in (response.find("{"), response.find("[")) if i >= 0), default=-1)
+    if start >= 0:
+        try:
+            parsed, _ = json.JSONDecoder().raw_decode(response[start:])
+        except json.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, dict):
+            parsed = next((value for value in parsed.values() if isinstance(value, list)), None)
+        if isinstance(parsed, list) and len(parsed) == count:
+            descriptions = [None] * count
+            for position, item in enumerate(parsed):
+                if isinstance(item, dict):
+                    index = item.get("imagen", position + 1)
+                    text = item.get("descripcion") or item.get("description")
+                else:
+                    index, text = position + 1, item
+                if isinstance(index, int) and 1 <= index <= count and isinstance(text, str):
+                    descriptions[index - 1] = text
+
+    if descriptions is None:
+        markers = list(re.finditer(r"^\W*(?:imagen\s+)?(\d+)\s*(?:\*\*)?[.):\-]\s*(?:\*\*)?\s*", response, re.IGNORECASE | re.MULTILINE))
+        if [int(marker.group(1)) for marker in markers] == list(range(1, count + 1)):
+            ends = [marker.start() for marker in markers[1:]] + [len(response)]
+            descriptions = [response[marker.end():end] for marker, end in zip(markers, ends)]
+
+    if not descriptions:
+        return None
+    descriptions = [text.strip() if isinstance(text, str) else None for text in descriptions]
+    if not all(text and "no puedo ver la imagen" not in text.lower() for text in descriptions):
+        return None
+    return descriptions
+
+def _describe_batch(doc_artifact_path: str, image_metas: list[dict], latencies: list | None = None) -> list[tuple[str | None, str | None]]:
+    """
+    Describe varias figuras pequeñas con una sola petición y devuelve un resultado
+    (descripción, error) por imagen, como _describe_image. Si la petición falla o la
+    respuesta no trae una descripción válida por imagen, describe cada una por separado.
+    """
+    if len(image_metas) == 1:
+        return [_describe_image(doc_artifact_path, image_metas[0], latencies)]
+
+    ids = ", ".join(image_meta["id"] for image_meta in image_metas)
+    paths = [os.path.join(doc_artifact_path, image_meta["optimized_path"]) for image_meta in image_metas]
+    prompt = config.PROMPTS["DESCRIBE_IMAGES_BATCH_ES"].format(count=len(image_metas))
+    try:
+        start = time.monotonic()
+        response = cliente_ollama.describe_images(paths, prompt, json_format=True)
+        if latencies is not None:
+            latencies.append(time.monotonic() - start)
+        descriptions = _parse_batch_response(response, len(image_metas))
+        if descriptions:
+            logging.info(f"      -> ÉXITO para {ids} (lote de {len(image_metas)})")
+            return [(description, None) for description in descriptions]
+        logging.warning(f"      -> Respuesta no interpretable para el lote {ids}; se describirán por separado.")
+    except cliente_ollama.CircuitOpenError:
+        raise
+    except Exception as e:
+        logging.warning(f"      -> Falló el lote {ids} ({e}); se describirán por separado.")
+
+    return [_describe_image(doc_artifact_path, image_meta, latencies) for image_meta in image_metas]
+
+def _is_valid_description(description: str | None) -> bool:
+    # Los metadatos anteriores a description_status guardaban los errores como texto de la descripción
+    return bool(description) and "Error" not in description and description != "No se pudo generar una descripción válida."
+
+def has_description(image_meta: dict) -> bool:
+    """Indica si la imagen tiene una descripción válida del modelo."""
+    if "description_status" in image_meta:
+        return image_meta["description_status"] == "ok" and bool(image_meta.get("description"))
+    return _is_valid_description(image_meta.get("description"))
+
+def description_failed(image_meta: dict) -> bool:
+    """Indica si la descripción de la imagen se intentó y falló (candidata a retry_descriptions.py)."""
+    if "description_status" in image_meta:
+        return image_meta["description_status"] == "failed"
+    return bool(image_meta.get("description")) and not _is_valid_description(image_meta["description"])
+
+def _leader_description(work_dir: str, obra_name: str, metadata: dict, duplicate_of: dict, metadata_by_obra: dict) -> str | None:
+    """
+    Busca la descripción válida de la imagen líder de una seguidora casi duplicada, leyendo
+    los metadatos de la obra de la líder (con memoria para no releerlos en cada imagen).
+    """
+    leader_obra = duplicate_of["obra"]
+    if leader_obra == obra_name:
+        leader_metadata = metadata
+    else:
+        if leader_obra not in metadata_by_obra:
+            # Incluye las descripciones aún en el diario si la líder se está describiendo en paralelo
+            try:
+                metadata_by_obra[leader_obra] = diario_metadatos.load_metadata(os.path.join(work_dir, config.OUTPUT_DIRS["ARTIFACTS"], leader_obra))
+            except (FileNotFoundError, json.JSONDecodeError):
+                metadata_by_obra[leader_obra] = {}
+        leader_metadata = metadata_by_obra[leader_obra]
+
+    for img in leader_metadata.get("images", []):
+        if img["id"] == duplicate_of["id"]:
+            return img["description"] if has_description(img) else None
+    return None
+
+def generate_descriptions_for_doc(doc_artifact_path: str, force_retry: bool = False, latencies: list | None = None):
     """
     Genera descripciones para las imágenes optimizadas.
     Por defecto, solo procesa imágenes sin descripción.
-    Si force_retry es True, procesará imágenes cuya descripción contenga un error.
+    Si force_retry es True, procesará imágenes cuya descripción falló.
+    Con latencies, recoge en esa lista la latencia de cada petición al modelo.
+    Los fallos se guardan como description_status="failed" y description_error. Si el
+    circuito de Ollama se abre, las imágenes restantes quedan pendientes y devuelve False
+    para que la obra se reintente más tarde.
+    Con DESCRIPTION_BATCH_CONFIG["ENABLED"], las figuras pequeñas se agrupan en peticiones
+    de hasta MAX_IMAGES imágenes.
     """
     log_level = "INFO" if not force_retry else "DEBUG"
     logging.log(getattr(logging, log_level), "  [Paso 3] Generando descripciones con Ollama...")
-    metadata_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"])
 
+    # Integrar el diario que haya dejado una ejecución interrumpida antes de decidir qué describir
+    if not diario_metadatos.compact(doc_artifact_path):
+        return False
     try:
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
+        metadata = diario_metadatos.load_metadata(doc_artifact_path)
     except (FileNotFoundError, json.JSONDecodeError) as e:
         logging.error(f"    No se pudo leer o decodificar el archivo de metadatos: {e}")
         return False
 
     if force_retry:
-        images_to_describe = [img for img in metadata["images"] if "Error" in str(img.get("description"))]
+        images_to_describe = [img for img in metadata["images"] if description_failed(img)]
     else:
-        images_to_describe = [img for img in metadata["images"] if img.get("optimized_path") and not img.get("description")]
+        images_to_describe = [img for img in metadata["images"] if img.get("optimized_path") and not img.get("skipped")
+                              and not img.get("description") and not img.get("description_status")]
 
     if not images_to_describe:
         logging.info("    -> No hay imágenes nuevas que describir.")
         return True
 
-    logging.info(f"    -> {len(images_to_describe)} imágenes para describir con {config.OLLAMA_CONFIG['MODEL_NAME']}.")
+    model_name = config.OLLAMA_CONFIG["MODEL_NAME"]
+    prompt = config.PROMPTS["DESCRIBE_IMAGE_ES"]
+    logging.info(f"    -> {len(images_to_describe)} imágenes para describir con {model_name}.")
 
-    for image_meta in images_to_describe:
-        optimized_full_path = os.path.join(doc_artifact_path, image_meta["optimized_path"])
-        description = None
-        try:
-            with open(optimized_full_path, "rb") as img_file:
-                image_bytes = img_file.read()
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-
-            payload = {
-                "model": config.OLLAMA_CONFIG["MODEL_NAME"],
-                "stream": False,
-                "messages": [{
-                    "role": "user",
-                    "content": config.PROMPTS["DESCRIBE_IMAGE_ES"],
-                    "images": [base64_image]
-                }]
-            }
-
-            response = requests.post(
-                config.OLLAMA_CONFIG["API_ENDPOINT_CHAT"],
-                json=payload,
-                timeout=config.OLLAMA_CONFIG["REQUEST_TIMEOUT"]
-            )
-            response.raise_for_status()
-            response_data = response.json()
-            description = response_data.get("message", {}).get("content")
-
-            if description and "no puedo ver la imagen" not in description.lower():
-                description = description.strip()
-                logging.info(f"      -> ÉXITO para {image_meta['id']}")
+    # La caché vive por defecto en la raíz del directorio de trabajo (.../02_artefactos_extraidos/{obra})
+    work_dir = os.path.dirname(os.path.dirname(os.path.abspath(doc_artifact_path)))
+    obra_name = os.path.basename(os.path.normpath(doc_artifact_path))
+    cache = cache_descripciones.open_cache(work_dir)
+    metadata_by_obra = {}
+
+    # Las descripciones se piden en paralelo (hasta la capacidad sumada de los endpoints) y se
+    # recogen en el orden original, guardando cada una en cuanto está disponible. Cada petición
+    # (de una imagen o de un lote) es un futuro con una lista de resultados; las imágenes
+    # apuntan a su posición en esa lista.
+    batch_config = config.DESCRIPTION_BATCH_CONFIG
+    max_workers = cliente_ollama.get_balancer().max_concurrency
+    journal = diario_metadatos.MetadataJournal(doc_artifact_path)
+    success = True
+    failed = 0
+    deferred = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Cada imagen se resuelve con la descripción de su líder casi duplicada, con una
+        # descripción de la caché o con la petición de la primera imagen idéntica del
+        # documento, de modo que ninguna se envía dos veces. requests_by_id guarda, por imagen,
+        # la descripción ya resuelta o la petición pendiente, para que sus seguidoras de la
+        # misma obra la reutilicen.
+        plan = []
+        requests_by_hash = {}
+        requests_by_id = {}
+        batch, batch_slots = [], []
+
+        def submit_batch():
+            future = executor.submit(_describe_batch, doc_artifact_path, list(batch), latencies)
+            for slot in batch_slots:
+                slot["future"] = future
+            batch.clear()
+            batch_slots.clear()
+
+        for image_meta in images_to_describe:
+            duplicate_of = image_meta.get("duplicate_of")
+            if duplicate_of:
+                if duplicate_of["obra"] == obra_name and duplicate_of["id"] in requests_by_id:
+                    requests_by_id[image_meta["id"]] = requests_by_id[duplicate_of["id"]]
+                    plan.append((image_meta, None, requests_by_id[duplicate_of["id"]]))
+                    continue
+                leader_description = _leader_description(work_dir, obra_name, metadata, duplicate_of, metadata_by_obra)
+                if leader_description:
+                    requests_by_id[image_meta["id"]] = leader_description
+                    plan.append((image_meta, None, leader_description))
+                    continue
+                # Si la líder aún no tiene descripción válida, la seguidora se describe por sí misma
+
+            image_hash = None
+            if cache:
+                try:
+                    image_hash = cache_descripciones.hash_file(os.path.join(doc_artifact_path, image_meta["optimized_path"]))
+                except OSError:
+                    pass  # _describe_image registrará el error de lectura
+
+            if image_hash:
+                cached_description = cache.get(image_hash, model_name, prompt)
+                if cached_description:
+                    requests_by_id[image_meta["id"]] = cached_description
+                    plan.append((image_meta, image_hash, cached_description))
+                    continue
+                if image_hash in requests_by_hash:
+                    requests_by_id[image_meta["id"]] = requests_by_hash[image_hash]
+                    plan.append((image_meta, image_hash, requests_by_hash[image_hash]))
+                    continue
+
+            if batch_config["ENABLED"] and _is_small_figure(doc_artifact_path, image_meta):
+                slot = {"future": None, "index": len(batch)}  # El futuro se asigna al enviar el lote
+                batch.append(image_meta)
+                batch_slots.append(slot)
+                if len(batch) >= batch_config["MAX_IMAGES"]:
+                    submit_batch()
             else:
-                description = "No se pudo generar una descripción válida."
-                logging.warning(f"      -> FALLO para {image_meta['id']}: Descripción no válida.")
-
-        except FileNotFoundError:
-            description = f"Error: Archivo de imagen no encontrado en {optimized_full_path}"
-            logging.error(f"    {description}")
-        except requests.exceptions.RequestException as e:
-            description = f"Error de API: {e}"
-            logging.error(f"    Error de API para {image_meta['id']}: {e}")
-        except Exception as e:
-            description = f"Error inesperado: {e}"
-            logging.error(f"    Error inesperado para {image_meta['id']}: {e}")
-        
-        # --- Guardado Incremental ---
-        if description:
+                slot = {"future": executor.submit(_describe_batch, doc_artifact_path, [image_meta], latencies), "index": 0}
+            if image_hash:
+                requests_by_hash[image_hash] = slot
+            requests_by_id[image_meta["id"]] = slot
+            plan.append((image_meta, image_hash, slot))
+        if batch:
+            submit_batch()
+
+        for image_meta, image_hash, source in plan:
+            fresh = False
+            if isinstance(source, str):
+                description, error = source, None
+                origin = f"duplicado de {image_meta['duplicate_of']['obra']}/{image_meta['duplicate_of']['id']}" if image_meta.get("duplicate_of") else "caché"
+                logging.info(f"      -> ÉXITO para {image_meta['id']} ({origin})")
+            else:
+                try:
+                    description, error = source["future"].result()[source["index"]]
+                except cliente_ollama.CircuitOpenError:
+                    # Sin intento: la imagen sigue pendiente para la próxima ejecución de la etapa
+                    deferred += 1
+                    continue
+                fresh = True
+
+            if cache and image_hash and fresh and description:
+                cache.put(image_hash, model_name, prompt, description)
+
+            # --- Guardado Incremental (una línea en el diario por descripción) ---
+            if description:
+                fields = {"description": description, "description_status": "ok", "description_error": None}
+            else:
+                failed += 1
+                fields = {"description": None, "description_status": "failed", "description_error": error}
             try:
-                with open(metadata_path, "r+", encoding="utf-8") as f:
-                    # Recargar por si acaso, aunque en este flujo no es estrictamente necesario
-                    current_metadata = json.load(f)
-                    # Encontrar y actualizar la imagen correcta
-                    for img in current_metadata.get("images", []):
-                        if img["id"] == image_meta["id"]:
-                            img["description"] = description
-                            break
-                    # Sobrescribir el archivo
-                    f.seek(0)
-                    json.dump(current_metadata, f, indent=4)
-                    f.truncate()
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                logging.error(f"    FALLO CRÍTICO al guardar incrementalmente para {image_meta['id']}: {e}")
+                journal.update_image(image_meta["id"], **fields)
+            except OSError as e:
                 # Si no podemos guardar, detener este proceso para no perder más tiempo/recursos
-                return False
+                logging.error(f"    FALLO CRÍTICO al guardar incrementalmente para {image_meta['id']}: {e}")
+                executor.shutdown(wait=False, cancel_futures=True)
+                success = False
+                break
+
+    journal.close()
+    if not diario_metadatos.compact(doc_artifact_path):
+        success = False
+
+    if cache:
+        logging.info(f"    -> Caché de descripciones: {cache.hits} aciertos, {cache.misses} fallos.")
+        cache.evict()
+        cache.close()
+
+    if failed:
+        logging.warning(f"    -> {failed} imágenes sin descripción por fallos del modelo (ver description_error; reintentables con retry_descriptions.py).")
+    if deferred:
+        logging.warning(f"    -> Circuito de Ollama abierto: {deferred} imágenes quedan pendientes para un intento posterior.")
+        success = False
+
+    if not success:
+        return False
 
     logging.info("  [Paso 3] Generación de descripciones completada.")
     return True
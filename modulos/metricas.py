@@ -0,0 +1,195 @@
+# modulos/metricas.py
+# Instrumentación por obra y etapa, y resumen de la ejecución (JSON, CSV y Prometheus).
+
+import os
+import csv
+import glob
+import json
+import time
+import resource
+import logging
+from contextlib import contextmanager
+import config
+from modulos.estado_trabajos import STAGES
+
+CSV_FIELDS = ["obra", "stage", "success", "started", "wall_s", "cpu_s", "peak_rss_mb", "read_bytes", "written_bytes",
+              "images", "model_requests", "latency_p50_s", "latency_p95_s", "latency_p99_s"]
+
+def _cpu_seconds() -> float:
+    """CPU de usuario y sistema del proceso (todos sus hilos) y de sus subprocesos terminados."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _io_counters() -> tuple[int, int] | None:
+    """Bytes leídos y escritos por el proceso (incluidos sockets), o None fuera de Linux."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            counters = dict(line.split(":") for line in f)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _percentile(sorted_values: list[float], fraction: float) -> float | None:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))], 3)
+
+def _records_path(work_dir: str) -> str:
+    return os.path.join(work_dir, config.OUTPUT_DIRS["LOGS"], config.METRICS_CONFIG["RECORDS_FILENAME"].format(pid=os.getpid()))
+
+@contextmanager
+def measure(work_dir: str, obra: str, stage: str):
+    """
+    Mide una etapa de una obra y añade el registro al archivo de métricas del proceso. El
+    llamador completa el diccionario que se entrega ("success", "images") y puede pasar
+    record["model_latencies"] a la etapa de descripción para recoger las latencias del modelo.
+    La CPU, la E/S y el pico de memoria son los del proceso: en los hilos de descripción
+    incluyen el trabajo de las demás obras que se describen a la vez.
+    """
+    record = {"obra": obra, "stage": stage, "success": None, "images": None, "model_latencies": []}
+    if not config.METRICS_CONFIG["ENABLED"]:
+        yield record
+        return
+
+    started, wall_start, cpu_start, io_start = time.time(), time.perf_counter(), _cpu_seconds(), _io_counters()
+    try:
+        yield record
+    finally:
+        io_end = _io_counters()
+        record.update({
+            "started": started,
+            "wall_s": round(time.perf_counter() - wall_start, 3),
+            "cpu_s": round(_cpu_seconds() - cpu_start, 3),
+            # ru_maxrss está en KB en Linux: es el pico del proceso hasta el final de la etapa
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "read_bytes": io_end[0] - io_start[0] if io_start and io_end else None,
+            "written_bytes": io_end[1] - io_start[1] if io_start and io_end else None,
+        })
+        try:
+            with open(_records_path(work_dir), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.warning(f"  ADVERTENCIA: No se pudo registrar la métrica de {obra}/{stage}: {e}")
+
+def _load_records(log_dir: str) -> tuple[list[dict], list[str]]:
+    records = []
+    paths = sorted(glob.glob(os.path.join(log_dir, config.METRICS_CONFIG["RECORDS_FILENAME"].format(pid="*"))))
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Línea incompleta de un proceso interrumpido
+    return records, paths
+
+def _latency_summary(latencies: list[float]) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "model_requests": len(ordered),
+        "latency_p50_s": _percentile(ordered, 0.50),
+        "latency_p95_s": _percentile(ordered, 0.95),
+        "latency_p99_s": _percentile(ordered, 0.99),
+    }
+
+def _summarize(records: list[dict]) -> dict:
+    """Totales por etapa y filas por obra y etapa (con percentiles en lugar de las latencias crudas)."""
+    records = sorted(records, key=lambda record: (record["started"], STAGES.index(record["stage"])))
+    stages = {}
+    latencies_by_stage = {}
+    for record in records:
+        totals = stages.setdefault(record["stage"], {"runs": 0, "failed": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0,
+                                                     "read_bytes": 0, "written_bytes": 0, "images": 0})
+        totals["runs"] += 1
+        totals["failed"] += record["success"] is False
+        totals["wall_s"] += record["wall_s"]
+        totals["cpu_s"] += record["cpu_s"]
+        totals["peak_rss_mb"] = max(totals["peak_rss_mb"], record["peak_rss_mb"])
+        totals["read_bytes"] += record["read_bytes"] or 0
+        totals["written_bytes"] += record["written_bytes"] or 0
+        totals["images"] += record["images"] or 0
+        latencies_by_stage.setdefault(record["stage"], []).extend(record["model_latencies"])
+
+    stages = {stage: stages[stage] for stage in STAGES if stage in stages}
+    for stage, totals in stages.items():
+        totals["wall_s"], totals["cpu_s"] = round(totals["wall_s"], 3), round(totals["cpu_s"], 3)
+        totals["images_per_s"] = round(totals["images"] / totals["wall_s"], 2) if totals["wall_s"] else None
+        totals.update(_latency_summary(latencies_by_stage[stage]))
+
+    rows = []
+    for record in records:
+        row = {field: record.get(field) for field in CSV_FIELDS}
+        row.update(_latency_summary(record["model_latencies"]))
+        rows.append(row)
+    return {"stages": stages, "obras": rows}
+
+def _prometheus_text(summary: dict) -> str:
+    metrics = [
+        ("pipeline_stage_runs_total", "counter", "Ejecuciones de la etapa.", "runs"),
+        ("pipeline_stage_failures_total", "counter", "Ejecuciones fallidas de la etapa.", "failed"),
+        ("pipeline_stage_wall_seconds_total", "counter", "Tiempo de reloj acumulado de la etapa.", "wall_s"),
+        ("pipeline_stage_cpu_seconds_total", "counter", "Tiempo de CPU acumulado de la etapa.", "cpu_s"),
+        ("pipeline_stage_read_bytes_total", "counter", "Bytes leídos durante la etapa.", "read_bytes"),
+        ("pipeline_stage_written_bytes_total", "counter", "Bytes escritos durante la etapa.", "written_bytes"),
+        ("pipeline_stage_images_total", "counter", "Imágenes procesadas por la etapa.", "images"),
+        ("pipeline_stage_peak_rss_megabytes", "gauge", "Pico de memoria residente de los procesos de la etapa.", "peak_rss_mb"),
+    ]
+    lines = []
+    for name, metric_type, help_text, key in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        lines += [f'{name}{{stage="{stage}"}} {totals[key]}' for stage, totals in summary["stages"].items()]
+
+    name = "pipeline_model_latency_seconds"
+    lines += [f"# HELP {name} Latencia de las peticiones al modelo de descripción.", f"# TYPE {name} summary"]
+    for stage, totals in summary["stages"].items():
+        if not totals["model_requests"]:
+            continue
+        for quantile, key in (("0.5", "latency_p50_s"), ("0.95", "latency_p95_s"), ("0.99", "latency_p99_s")):
+            lines.append(f'{name}{{stage="{stage}",quantile="{quantile}"}} {totals[key]}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {totals["model_requests"]}')
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path: str, write):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8", newline="") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+def write_run_report(work_dir: str) -> str | None:
+    """
+    Agrega los registros de métricas de todos los procesos de la ejecución en el resumen
+    JSON y CSV de 00_log (y en el archivo de Prometheus, si está configurado), elimina los
+    registros temporales y escribe en el log los totales por etapa. Devuelve la ruta del
+    resumen JSON, o None si no hay registros.
+    """
+    metrics_config = config.METRICS_CONFIG
+    log_dir = os.path.join(work_dir, config.OUTPUT_DIRS["LOGS"])
+    records, paths = _load_records(log_dir)
+    if not records:
+        return None
+
+    summary = _summarize(records)
+    summary["created"] = time.time()
+    json_path = os.path.join(log_dir, metrics_config["SUMMARY_JSON"])
+    _write_atomic(json_path, lambda f: json.dump(summary, f, indent=4, ensure_ascii=False))
+
+    def write_csv(f):
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(summary["obras"])
+    _write_atomic(os.path.join(log_dir, metrics_config["SUMMARY_CSV"]), write_csv)
+
+    if metrics_config["PROMETHEUS_FILENAME"]:
+        _write_atomic(os.path.join(log_dir, metrics_config["PROMETHEUS_FILENAME"]), lambda f: f.write(_prometheus_text(summary)))
+
+    for path in paths:
+        os.remove(path)
+
+    logging.info("--- MÉTRICAS POR ETAPA ---")
+    for stage, totals in summary["stages"].items():
+        latency = f", latencia p50 {totals['latency_p50_s']:.2f} s / p95 {totals['latency_p95_s']:.2f} s" if totals["model_requests"] else ""
+        logging.info(f"  {stage}: {totals['runs']} obras ({totals['failed']} fallidas), {totals['wall_s']:.1f} s de reloj, "
+                     f"{totals['cpu_s']:.1f} s de CPU, {totals['images']} imágenes, pico {totals['peak_rss_mb']:.0f} MB{latency}")
+    logging.info(f"  Resumen de la ejecución: {json_path}")
+    return json_path
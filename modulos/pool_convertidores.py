@@ -0,0 +1,105 @@
+# modulos/pool_convertidores.py
+# Módulo que mantiene DocumentConverter de Docling "calientes" para reutilizarlos entre obras.
+
+import os
+import gc
+import logging
+import psutil
+import config
+from docling.document_converter import DocumentConverter, PdfFormatOption, WordFormatOption
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions, PipelineOptions, TableFormerMode
+from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
+from modulos import utils_fs
+
+# Un convertidor por combinación de opciones, por proceso: {opciones: {"converter", "documents"}}
+_converters = {}
+
+def conversion_options(source_path: str, want_text: bool, want_images: bool) -> tuple:
+    """
+    Opciones de conversión de un archivo: el perfil de DOCLING_PROFILES de la carpeta de la
+    obra en que está (ocr_pdf, img_pdf o "default" para la raíz), sin OCR ni tablas si el
+    archivo solo aporta imágenes. Devuelve una tupla ordenable que sirve de clave del pool.
+    """
+    folder = os.path.basename(os.path.dirname(source_path))
+    profile_name = folder if folder in utils_fs.SOURCE_SUBDIRS and folder in config.DOCLING_PROFILES else "default"
+    options = dict(config.DOCLING_PROFILES[profile_name], PROFILE=profile_name, GENERATE_PICTURE_IMAGES=want_images)
+    if not want_text:
+        options["DO_OCR"] = False
+        options["DO_TABLE_STRUCTURE"] = False
+    return tuple(sorted(options.items()))
+
+def _build_converter(options: tuple) -> DocumentConverter:
+    """Crea un DocumentConverter para PDF y DOCX con las opciones indicadas."""
+    options = dict(options)
+    pdf_pipeline_options = PdfPipelineOptions(
+        generate_picture_images=options["GENERATE_PICTURE_IMAGES"],
+        do_ocr=options["DO_OCR"],
+        do_table_structure=options["DO_TABLE_STRUCTURE"],
+    )
+    pdf_pipeline_options.table_structure_options.mode = TableFormerMode[options["TABLE_MODE"]]
+    if options["PDF_BACKEND"] == "pypdfium2":
+        pdf_format_option = PdfFormatOption(pipeline_options=pdf_pipeline_options, backend=PyPdfiumDocumentBackend)
+    else:
+        pdf_format_option = PdfFormatOption(pipeline_options=pdf_pipeline_options)
+
+    docx_pipeline_options = PipelineOptions(generate_picture_images=options["GENERATE_PICTURE_IMAGES"])
+    format_options = {
+        InputFormat.PDF: pdf_format_option,
+        InputFormat.DOCX: WordFormatOption(pipeline_options=docx_pipeline_options)
+    }
+    logging.info(f"    -> Nuevo convertidor de Docling con el perfil '{options['PROFILE']}' (OCR: {options['DO_OCR']}, "
+                 f"tablas: {options['TABLE_MODE'] if options['DO_TABLE_STRUCTURE'] else 'no'}, backend: {options['PDF_BACKEND'] or 'por defecto'}).")
+    return DocumentConverter(format_options=format_options)
+
+def _rss_exceeded() -> bool:
+    """Indica si la memoria residente del proceso supera el umbral configurado."""
+    max_rss_mb = config.DOCLING_CONFIG["CONVERTER_MAX_RSS_MB"]
+    if not max_rss_mb:
+        return False
+    return psutil.Process().memory_info().rss > max_rss_mb * 1024 * 1024
+
+def release_converters():
+    """Descarta todos los convertidores del proceso y libera la memoria de sus modelos."""
+    _converters.clear()
+    gc.collect()
+
+def get_converter(options: tuple) -> DocumentConverter:
+    """
+    Devuelve el convertidor para las opciones pedidas (ver conversion_options). Se crea la
+    primera vez y se recicla solo cuando alcanza el límite de documentos o el proceso excede
+    el umbral de memoria.
+    """
+    entry = _converters.get(options)
+
+    if entry and entry["documents"] >= config.DOCLING_CONFIG["CONVERTER_MAX_DOCUMENTS"]:
+        logging.info(f"    -> Reciclando el convertidor de Docling tras {entry['documents']} documentos.")
+        del _converters[options]
+        gc.collect()
+        entry = None
+
+    if _converters and _rss_exceeded():
+        logging.info("    -> Memoria del proceso por encima del umbral. Reciclando los convertidores de Docling.")
+        release_converters()
+        entry = None
+
+    if entry is None:
+        entry = {"converter": _build_converter(options), "documents": 0}
+        _converters[options] = entry
+
+    return entry["converter"]
+
+def convert(source_path: str, want_text: bool, want_images: bool, page_range: tuple[int, int] | None = None):
+    """
+    Convierte un documento con el convertidor compartido del perfil que le corresponde
+    según su carpeta y su uso (texto, imágenes o ambos). page_range (inicio, fin), con
+    páginas numeradas desde 1 e incluyendo el fin, limita la conversión a ese rango de páginas.
+    """
+    options = conversion_options(source_path, want_text, want_images)
+    converter = get_converter(options)
+    try:
+        if page_range:
+            return converter.convert(source_path, page_range=page_range)
+        return converter.convert(source_path)
+    finally:
+        _converters[options]["documents"] += 1
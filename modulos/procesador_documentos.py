@@ -3,13 +3,15 @@
 
 import os
 import json
-import gc
+import shutil
 import base64
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pypdfium2 as pdfium
 import config
 import logging
-from docling.document_converter import DocumentConverter, PdfFormatOption, WordFormatOption
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions, PipelineOptions
+from modulos import pool_convertidores
 
 def create_artifact_structure_for_doc(output_dir: str, doc_basename: str) -> str:
     """Crea la estructura de directorios para los artefactos de un documento."""
@@ -22,6 +24,111 @@ def create_artifact_structure_for_doc(output_dir: str, doc_basename: str) -> str
     
     return doc_artifact_path
 
+def _save_picture(picture, document, img_filepath: str):
+    """
+    Escribe la imagen de una figura de Docling. Usa directamente el objeto PIL cuando está
+    disponible y, si no, decodifica el data URI en base64.
+    """
+    pil_image = picture.get_image(document)
+    if pil_image is not None:
+        pil_image.save(img_filepath, format="PNG")
+        return
+
+    header, base64_data = str(picture.image.uri).split(',', 1)
+    with open(img_filepath, "wb") as f:
+        f.write(base64.b64decode(base64_data))
+
+def _pdf_page_count(path: str) -> int:
+    """Devuelve el número de páginas de un PDF, o 0 si no se puede leer."""
+    try:
+        pdf = pdfium.PdfDocument(path)
+    except Exception:
+        return 0
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def _convert_part(source_file: str, page_range: tuple[int, int] | None, want_text: bool, want_images: bool, part_dir: str | None) -> tuple[str | None, list[str | None], str | None]:
+    """
+    Convierte un archivo completo o un rango de sus páginas. Puede ejecutarse en un proceso
+    del pool. Las imágenes se escriben en part_dir con nombres provisionales en orden.
+    Devuelve (markdown, rutas de las imágenes (None si falló su escritura), error).
+    """
+    try:
+        result = pool_convertidores.convert(source_file, want_text=want_text, want_images=want_images, page_range=page_range)
+    except Exception as e:
+        return None, [], str(e)
+
+    markdown = result.document.export_to_markdown() if want_text else None
+    picture_paths = []
+    if want_images:
+        os.makedirs(part_dir, exist_ok=True)
+        for n, picture in enumerate(result.document.pictures, start=1):
+            picture_path = os.path.join(part_dir, f"{n:05d}.png")
+            try:
+                _save_picture(picture, result.document, picture_path)
+                picture_paths.append(picture_path)
+            except Exception as e:
+                print(f"    ADVERTENCIA: No se pudo guardar una imagen de '{os.path.basename(source_file)}'. Razón: {e}")
+                picture_paths.append(None)
+    return markdown, picture_paths, None
+
+# Pool de procesos para convertir por rangos de páginas; se reutiliza para mantener los modelos cargados
+_executor = None
+_executor_workers = 0
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown()
+        mp_context = multiprocessing.get_context(config.PARALLEL_CONFIG["START_METHOD"])
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+        _executor_workers = workers
+    return _executor
+
+def _discard_executor():
+    """Descarta el pool (p. ej. roto porque el OOM killer terminó un proceso) para que el siguiente uso cree uno nuevo."""
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor, _executor_workers = None, 0
+
+def _convert_source(source_file: str, want_text: bool, want_images: bool, work_dir: str | None):
+    """
+    Convierte un archivo fuente y produce, en orden de página, tuplas
+    (rango de páginas, markdown, rutas de imágenes, error). Los PDF grandes se dividen en
+    rangos de CHUNK_PAGES páginas que se convierten en paralelo; el resto se convierte entero.
+    Si un proceso del pool muere, el pool se descarta y los rangos pendientes se devuelven
+    con su error (los ya entregados se conservan).
+    """
+    docling_config = config.DOCLING_CONFIG
+    page_count = _pdf_page_count(source_file) if source_file.lower().endswith(".pdf") else 0
+    if page_count < docling_config["CHUNK_MIN_PAGES"]:
+        part_dir = os.path.join(work_dir, ".parte_0000") if work_dir else None
+        yield (None, *_convert_part(source_file, None, want_text, want_images, part_dir))
+        return
+
+    chunk_pages = docling_config["CHUNK_PAGES"]
+    page_ranges = [(start, min(start + chunk_pages - 1, page_count)) for start in range(1, page_count + 1, chunk_pages)]
+    part_dirs = [os.path.join(work_dir, f".parte_{k:04d}") if work_dir else None for k in range(len(page_ranges))]
+    workers = min(docling_config["CHUNK_WORKERS"], len(page_ranges))
+    print(f"    -> '{os.path.basename(source_file)}' tiene {page_count} páginas: se convierte en {len(page_ranges)} partes con {workers} proceso(s).")
+
+    args = ([source_file] * len(page_ranges), page_ranges, [want_text] * len(page_ranges), [want_images] * len(page_ranges), part_dirs)
+    delivered = 0
+    try:
+        results = _get_executor(workers).map(_convert_part, *args) if workers > 1 else map(_convert_part, *args)
+        for page_range, result in zip(page_ranges, results):
+            yield (page_range, *result)
+            delivered += 1
+    except BrokenProcessPool as e:
+        _discard_executor()
+        error = f"Un proceso de conversión terminó abruptamente: {e}"
+        for page_range in page_ranges[delivered:]:
+            yield (page_range, None, [], error)
+
 def extract_artifacts_from_corpus(sources: dict, output_dir: str, obra_name: str) -> str | None:
     """
     Usa Docling para extraer artefactos de un conjunto de fuentes de corpus.
@@ -35,68 +142,65 @@ def extract_artifacts_from_corpus(sources: dict, output_dir: str, obra_name: str
         print(f"    ERROR: No se pudo crear la estructura de directorios para {obra_name}. Razón: {e}")
         return None
 
-    # --- Configurar Docling --- 
-    pdf_pipeline_options = PdfPipelineOptions(generate_picture_images=True)
-    docx_pipeline_options = PipelineOptions(generate_picture_images=True)
-    format_options = {
-        InputFormat.PDF: PdfFormatOption(pipeline_options=pdf_pipeline_options),
-        InputFormat.DOCX: WordFormatOption(pipeline_options=docx_pipeline_options)
-    }
-    converter = DocumentConverter(format_options=format_options)
-
     # --- Procesar y agregar resultados ---
-    full_text = ""
-    all_pictures = []
-
-    # Procesar TEXTO de la mejor fuente
-    print(f"    -> Procesando {len(sources['text'])} archivo(s) para TEXTO.")
-    for text_file in sources['text']:
-        try:
-            result = converter.convert(text_file)
-            full_text += result.document.export_to_markdown() + "\n\n---\n\n"
-        except Exception as e:
-            print(f"    ADVERTENCIA: Docling falló al procesar el archivo de texto '{os.path.basename(text_file)}'. Razón: {e}")
-
-    # Procesar IMÁGENES de la mejor fuente
-    print(f"    -> Procesando {len(sources['image'])} archivo(s) para IMÁGENES.")
-    for image_file in sources['image']:
-        try:
-            result = converter.convert(image_file)
-            all_pictures.extend(result.document.pictures)
-        except Exception as e:
-            print(f"    ADVERTENCIA: Docling falló al procesar el archivo de imagen '{os.path.basename(image_file)}'. Razón: {e}")
-
-    del converter
-    gc.collect()
-
+    text_by_file = {}
     metadata = {"source_files": sources, "images": [], "tables": []}
-
-    # Guardar el texto agregado
+    images_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["ORIGINAL_IMAGES"])
+    picture_count = 0
+
+    # Cada archivo se convierte una sola vez: si es fuente de TEXTO y de IMÁGENES a la vez
+    # (ej. PDF/DOCX en la raíz de la obra) ambos se toman del mismo resultado. Los archivos
+    # usados solo para texto se convierten sin generar imágenes de las figuras. Las fuentes
+    # de imágenes se recorren en su orden para que la numeración img_NNN sea estable.
+    text_files = set(sources['text'])
+    image_files = set(sources['image'])
+    files_to_convert = [f for f in sources['text'] if f not in image_files] + list(dict.fromkeys(sources['image']))
+    print(f"    -> Procesando {len(files_to_convert)} archivo(s): {len(text_files)} para TEXTO, {len(image_files)} para IMÁGENES.")
+    for source_file in files_to_convert:
+        use_for_text = source_file in text_files
+        use_for_images = source_file in image_files
+        markdown_parts = []
+
+        # Las imágenes se escriben en disco en cuanto se convierte su archivo (o su rango de
+        # páginas), para que la memoria retenida no dependa del tamaño de la obra completa
+        for page_range, markdown, picture_paths, error in _convert_source(source_file, use_for_text, use_for_images, images_path):
+            if error:
+                pages = f" (páginas {page_range[0]}-{page_range[1]})" if page_range else ""
+                print(f"    ADVERTENCIA: Docling falló al procesar el archivo '{os.path.basename(source_file)}'{pages}. Razón: {error}")
+                continue
+            if markdown is not None:
+                markdown_parts.append(markdown)
+
+            # Renombrar las imágenes provisionales con la numeración estable de la obra
+            for picture_path in picture_paths:
+                picture_count += 1
+                image_id = f"img_{picture_count:03d}"
+                img_filename = f"{image_id}.png"
+                if picture_path is None:
+                    print(f"    ADVERTENCIA: No se pudo guardar la imagen {picture_count}.")
+                    continue
+                os.replace(picture_path, os.path.join(images_path, img_filename))
+                metadata["images"].append({
+                    "id": image_id,
+                    "original_path": os.path.join(config.ARTIFACT_SUBDIRS["ORIGINAL_IMAGES"], img_filename),
+                    "optimized_path": None,
+                    "description": None
+                })
+
+        if markdown_parts:
+            text_by_file[source_file] = "\n\n".join(markdown_parts)
+
+        for part_dir in os.listdir(images_path):
+            if part_dir.startswith(".parte_"):
+                shutil.rmtree(os.path.join(images_path, part_dir), ignore_errors=True)
+
+    # Guardar el texto agregado, en el orden de las fuentes de texto
+    full_text = "".join(text_by_file[f] + "\n\n---\n\n" for f in sources['text'] if f in text_by_file)
     text_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["TEXT"])
     with open(text_path, "w", encoding="utf-8") as f:
         f.write(full_text)
     print(f"    -> Texto agregado guardado en: {config.ARTIFACT_SUBDIRS['TEXT']}")
-
-    # Guardar las imágenes agregadas
-    images_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["ORIGINAL_IMAGES"])
-    for i, picture in enumerate(all_pictures):
-        img_filename = f"img_{i+1:03d}.png"
-        img_filepath = os.path.join(images_path, img_filename)
-        try:
-            header, base64_data = str(picture.image.uri).split(',', 1)
-            image_bytes = base64.b64decode(base64_data)
-            with open(img_filepath, "wb") as f:
-                f.write(image_bytes)
-
-            metadata["images"].append({
-                "id": f"img_{i+1:03d}",
-                "original_path": os.path.join(config.ARTIFACT_SUBDIRS["ORIGINAL_IMAGES"], img_filename),
-                "optimized_path": None,
-                "description": None
-            })
-        except Exception as e:
-            print(f"    ADVERTENCIA: No se pudo guardar la imagen {i+1}. Razón: {e}")
-    print(f"    -> {len(all_pictures)} imágenes guardadas en: {config.ARTIFACT_SUBDIRS['ORIGINAL_IMAGES']}")
+    print(f"    -> {picture_count} imágenes guardadas en: {config.ARTIFACT_SUBDIRS['ORIGINAL_IMAGES']}")
 
     metadata_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"])
     with open(metadata_path, "w", encoding="utf-8") as f:
@@ -111,27 +215,19 @@ def regenerate_text_artifact(sources: dict, doc_artifact_path: str) -> bool:
     Procesa únicamente la mejor fuente de texto y sobrescribe el artefacto de texto existente.
     No toca las imágenes ni los metadatos.
     """
-    # --- Configurar Docling ---
-    pdf_pipeline_options = PdfPipelineOptions(generate_picture_images=False) # No necesitamos imágenes aquí
-    docx_pipeline_options = PipelineOptions(generate_picture_images=False)
-    format_options = {
-        InputFormat.PDF: PdfFormatOption(pipeline_options=pdf_pipeline_options),
-        InputFormat.DOCX: WordFormatOption(pipeline_options=docx_pipeline_options)
-    }
-    converter = DocumentConverter(format_options=format_options)
-
     # --- Procesar y agregar texto ---
     full_text = ""
     logging.info(f"    -> Procesando {len(sources['text'])} archivo(s) para TEXTO.")
     for text_file in sources['text']:
-        try:
-            result = converter.convert(text_file)
-            full_text += result.document.export_to_markdown() + "\n\n---\n\n"
-        except Exception as e:
-            logging.warning(f"    Docling falló al procesar el archivo de texto '{os.path.basename(text_file)}'. Razón: {e}")
-
-    del converter
-    gc.collect()
+        markdown_parts = []
+        # No necesitamos imágenes aquí
+        for page_range, markdown, _, error in _convert_source(text_file, want_text=True, want_images=False, work_dir=None):
+            if error:
+                logging.warning(f"    Docling falló al procesar el archivo de texto '{os.path.basename(text_file)}'. Razón: {error}")
+                continue
+            markdown_parts.append(markdown)
+        if markdown_parts:
+            full_text += "\n\n".join(markdown_parts) + "\n\n---\n\n"
 
     # --- Sobrescribir el artefacto de texto ---
     if not full_text:
@@ -2,66 +2,170 @@
 # Módulo para optimizar imágenes y actualizar metadatos.
 
 import os
-import json
 import io
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 from PIL import Image
 import config
+from modulos import diario_metadatos
+
+def classify_trivial_image(image: Image.Image) -> str | None:
+    """
+    Decide si una imagen es trivial (demasiado pequeña, alargada o de color casi sólido) a
+    partir de sus dimensiones y de la luminancia de sus píxeles. No se mide la entropía: un
+    diagrama de trazo fino o una firma tienen muy poca tinta y, aun así, contenido.
+    Devuelve el motivo o None si la imagen debe describirse.
+    """
+    settings = config.IMAGE_PROCESSING_CONFIG
+    width, height = image.size
+    short_side, long_side = min(width, height), max(width, height)
+
+    if short_side < settings["MIN_SIDE_PX"] or width * height < settings["MIN_AREA_PX"]:
+        return f"demasiado pequeña ({width}x{height} px)"
+    if long_side / short_side > settings["MAX_ASPECT_RATIO"]:
+        return f"proporción extrema ({width}x{height} px)"
+
+    # Las estadísticas se calculan sobre una muestra de píxeles (vecino más cercano, sin promediar,
+    # para no suavizar texturas finas como el texto): igual de representativa y mucho más barata
+    scale = min(1.0, 256 / long_side)
+    sample_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    pixels = np.asarray(image.resize(sample_size, Image.Resampling.NEAREST).convert("L"), dtype=np.uint8)
+
+    std_dev = float(pixels.std())
+    if std_dev < settings["MIN_STD_DEV"]:
+        return f"color casi sólido (desviación {std_dev:.1f})"
+
+    return None
+
+FORMAT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+
+def choose_format(image: Image.Image) -> str:
+    """
+    Elige el formato de salida. En modo AUTO, las imágenes con pocos colores distintos
+    (diagramas, dibujos de línea, texto) van a PNG y el resto al formato con pérdida.
+    """
+    settings = config.IMAGE_PROCESSING_CONFIG
+    if settings["OPTIMIZED_FORMAT"] != "AUTO":
+        return settings["OPTIMIZED_FORMAT"]
+
+    # Cuantizar a 16 niveles por canal para que el ruido de escaneo o JPEG no cuente como color
+    sample = image.copy()
+    sample.thumbnail((256, 256), Image.Resampling.NEAREST)
+    pixels = np.asarray(sample.convert("RGB"), dtype=np.uint8) >> 4
+    packed = (pixels[..., 0].astype(np.uint16) << 8) | (pixels[..., 1].astype(np.uint16) << 4) | pixels[..., 2]
+    distinct_colors = np.unique(packed).size
+    return "PNG" if distinct_colors <= settings["LINE_ART_MAX_COLORS"] else settings["LOSSY_FORMAT"]
+
+def encode_image(image: Image.Image, image_format: str) -> tuple[bytes, str]:
+    """
+    Codifica la imagen en el formato indicado intentando no superar MAX_PAYLOAD_BYTES:
+    primero baja la calidad (formatos con pérdida), después pasa de PNG a formato con
+    pérdida y, como último recurso, reduce las dimensiones. Devuelve (bytes, formato).
+    """
+    settings = config.IMAGE_PROCESSING_CONFIG
+    max_bytes = settings["MAX_PAYLOAD_BYTES"]
+    initial_quality = {"JPEG": settings["JPEG_QUALITY"], "WEBP": settings["WEBP_QUALITY"]}
+    quality = initial_quality.get(image_format)
+
+    while True:
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            # JPEG no admite transparencia: componer sobre fondo blanco
+            background = Image.new("RGB", image.size, "white")
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+
+        buffer = io.BytesIO()
+        if image_format == "PNG":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format=image_format, quality=quality)
+        data = buffer.getvalue()
+
+        if not max_bytes or len(data) <= max_bytes:
+            return data, image_format
+        if image_format != "PNG" and quality > settings["MIN_QUALITY"]:
+            quality = max(settings["MIN_QUALITY"], quality - 10)
+        elif image_format == "PNG":
+            image_format = settings["LOSSY_FORMAT"]
+            quality = initial_quality[image_format]
+        elif min(image.size) > 64:
+            image = image.resize((max(1, int(image.width * 0.75)), max(1, int(image.height * 0.75))), Image.Resampling.LANCZOS)
+            quality = initial_quality[image_format]
+        else:
+            return data, image_format
+
+def _optimize_image(original_full_path: str, optimized_full_path: str) -> dict:
+    """
+    Optimiza una sola imagen. Se ejecuta en un proceso del pool: lee el archivo original
+    directamente (sin copiarlo a memoria) y escribe el resultado con la extensión del
+    formato elegido. Devuelve los campos a actualizar en los metadatos o {"error": motivo}.
+    """
+    max_dim = config.IMAGE_PROCESSING_CONFIG["MAX_DIMENSION"]
+    try:
+        with Image.open(original_full_path) as image:
+            # Las imágenes triviales no se optimizan ni se envían al modelo
+            if config.IMAGE_PROCESSING_CONFIG["SKIP_TRIVIAL_IMAGES"]:
+                skip_reason = classify_trivial_image(image)
+                if skip_reason:
+                    return {"skipped": True, "skip_reason": skip_reason}
+
+            if image.width > max_dim or image.height > max_dim:
+                image.thumbnail((max_dim, max_dim))
+
+            optimized_bytes, image_format = encode_image(image, choose_format(image))
+
+        optimized_full_path = os.path.splitext(optimized_full_path)[0] + FORMAT_EXTENSIONS[image_format]
+        with open(optimized_full_path, "wb") as opt_img_file:
+            opt_img_file.write(optimized_bytes)
+
+    except FileNotFoundError:
+        return {"error": f"No se encontró el archivo de imagen original: {original_full_path}"}
+    except Exception as e:
+        return {"error": f"No se pudo optimizar la imagen. Razón: {e}"}
+
+    return {
+        "optimized_path": os.path.join(config.ARTIFACT_SUBDIRS["OPTIMIZED_IMAGES"], os.path.basename(optimized_full_path)),
+        "optimized_format": image_format,
+        "optimized_bytes": len(optimized_bytes),
+    }
+
+# Pool de procesos del módulo, reutilizado entre obras para no pagar su arranque cada vez
+_executor = None
+_executor_workers = 0
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown()
+        mp_context = multiprocessing.get_context(config.PARALLEL_CONFIG["START_METHOD"])
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+        _executor_workers = workers
+    return _executor
+
+def _discard_executor():
+    """Descarta el pool (p. ej. roto porque el OOM killer terminó un proceso) para que el siguiente uso cree uno nuevo."""
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor, _executor_workers = None, 0
 
 def optimize_images_for_doc(doc_artifact_path: str):
     """
     Encuentra las imágenes originales, las optimiza y actualiza los metadatos.
+    Con IMAGE_PROCESSING_CONFIG["WORKERS"] > 1 las imágenes se reparten en un pool de
+    procesos; los metadatos se guardan por lotes de METADATA_BATCH_SIZE imágenes.
     """
     print("  [Paso 2] Optimizando imágenes...")
     metadata_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"])
-    
+
     try:
-        with open(metadata_path, "r+", encoding="utf-8") as f:
+        with open(metadata_path, "r", encoding="utf-8") as f:
             metadata = json.load(f)
-            
-            images_to_process = [img for img in metadata["images"] if not img.get("optimized_path")]
-            if not images_to_process:
-                print("    -> No hay imágenes nuevas que optimizar.")
-                return True
-
-            print(f"    -> {len(images_to_process)} imágenes para optimizar.")
-
-            for image_meta in images_to_process:
-                original_full_path = os.path.join(doc_artifact_path, os.path.dirname(image_meta["original_path"]), os.path.basename(image_meta["original_path"])) # Reconstrucción de la ruta completa
-                optimized_relative_path = os.path.join(config.ARTIFACT_SUBDIRS["OPTIMIZED_IMAGES"], os.path.basename(image_meta["original_path"])) # Ruta relativa para guardar
-                optimized_full_path = os.path.join(doc_artifact_path, optimized_relative_path)
-
-                try:
-                    with open(original_full_path, "rb") as img_file:
-                        original_bytes = img_file.read()
-                    
-                    image = Image.open(io.BytesIO(original_bytes))
-                    max_dim = config.IMAGE_PROCESSING_CONFIG["MAX_DIMENSION"]
-                    
-                    if image.width > max_dim or image.height > max_dim:
-                        image.thumbnail((max_dim, max_dim))
-                    
-                    output_buffer = io.BytesIO()
-                    image.save(output_buffer, format=config.IMAGE_PROCESSING_CONFIG["OPTIMIZED_FORMAT"])
-                    optimized_bytes = output_buffer.getvalue()
-
-                    with open(optimized_full_path, "wb") as opt_img_file:
-                        opt_img_file.write(optimized_bytes)
-                    
-                    # Actualizar metadatos
-                    image_meta["optimized_path"] = optimized_relative_path
-
-                except FileNotFoundError:
-                    print(f"    ERROR: No se encontró el archivo de imagen original: {original_full_path}")
-                    continue
-                except Exception as e:
-                    print(f"    ERROR: No se pudo optimizar la imagen {image_meta['id']}. Razón: {e}")
-                    continue
-
-            # Volver al inicio del archivo para sobrescribir
-            f.seek(0)
-            json.dump(metadata, f, indent=4)
-            f.truncate()
-
     except FileNotFoundError:
         print(f"    ERROR: No se encontró el archivo de metadatos en {doc_artifact_path}")
         return False
@@ -69,5 +173,51 @@ def optimize_images_for_doc(doc_artifact_path: str):
         print(f"    ERROR: El archivo de metadatos en {doc_artifact_path} está corrupto.")
         return False
 
+    images_to_process = [img for img in metadata["images"] if not img.get("optimized_path") and not img.get("skipped")]
+    if not images_to_process:
+        print("    -> No hay imágenes nuevas que optimizar.")
+        return True
+
+    print(f"    -> {len(images_to_process)} imágenes para optimizar.")
+
+    original_paths = [os.path.join(doc_artifact_path, image_meta["original_path"]) for image_meta in images_to_process]
+    optimized_paths = [
+        os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["OPTIMIZED_IMAGES"], os.path.basename(image_meta["original_path"]))
+        for image_meta in images_to_process
+    ]
+
+    workers = config.IMAGE_PROCESSING_CONFIG["WORKERS"] or os.cpu_count() or 1
+    workers = min(workers, len(images_to_process))
+    batch_size = config.IMAGE_PROCESSING_CONFIG["METADATA_BATCH_SIZE"]
+    skipped_count = 0
+    try:
+        if workers > 1:
+            chunksize = max(1, min(16, len(images_to_process) // (workers * 4)))
+            results = _get_executor(workers).map(_optimize_image, original_paths, optimized_paths, chunksize=chunksize)
+        else:
+            results = map(_optimize_image, original_paths, optimized_paths)
+
+        for processed, (image_meta, result) in enumerate(zip(images_to_process, results), start=1):
+            if "error" in result:
+                print(f"    ERROR: {image_meta['id']}: {result['error']}")
+            else:
+                image_meta.update(result)
+                skipped_count += bool(result.get("skipped"))
+
+            if processed % batch_size == 0:
+                diario_metadatos.write_metadata(metadata_path, metadata)
+    except BrokenProcessPool as e:
+        # Solo falla esta obra: las imágenes ya optimizadas quedan guardadas y las demás se
+        # optimizarán al reanudar; la siguiente obra usa un pool nuevo
+        _discard_executor()
+        print(f"    ERROR: Un proceso del pool de optimización terminó abruptamente: {e}")
+        return False
+    finally:
+        # Guardar lo procesado aunque el pool falle a mitad de camino
+        diario_metadatos.write_metadata(metadata_path, metadata)
+
+    if skipped_count:
+        print(f"    -> {skipped_count} imágenes triviales marcadas como omitidas.")
+
     print("  [Paso 2] Optimización completada.")
     return True
@@ -2,9 +2,14 @@
 # Utilidades para la gestión del sistema de archivos.
 
 import os
+import glob
+import json
 import shutil
+import hashlib
 import logging
 
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
 def setup_logging(log_dir: str, config: dict):
     """
     Configura el sistema de logging para que escriba a un archivo y a la consola.
@@ -17,13 +22,52 @@ def setup_logging(log_dir: str, config: dict):
     if not logging.getLogger().handlers:
         logging.basicConfig(
             level=getattr(logging, log_level.upper(), logging.INFO),
-            format='%(asctime)s - %(levelname)s - %(message)s',
+            format=LOG_FORMAT,
             handlers=[
                 logging.FileHandler(log_filepath),
                 logging.StreamHandler()
             ]
         )
 
+def setup_worker_logging(log_dir: str, config: dict):
+    """
+    Configura el logging de un proceso trabajador para que escriba en su propio archivo.
+    Los archivos por trabajador se fusionan en el log principal con merge_worker_logs().
+    """
+    root_logger = logging.getLogger()
+    # Descartar handlers heredados del proceso padre (relevante con el método 'fork')
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        handler.close()
+
+    worker_log_filepath = os.path.join(log_dir, config["WORKER_FILENAME"].format(pid=os.getpid()))
+    logging.basicConfig(
+        level=getattr(logging, config["LEVEL"].upper(), logging.INFO),
+        format=f'%(asctime)s - [pid {os.getpid()}] %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(worker_log_filepath),
+            logging.StreamHandler()
+        ]
+    )
+
+def merge_worker_logs(log_dir: str, config: dict) -> int:
+    """
+    Agrega al final del log principal el contenido de los logs de cada trabajador
+    y elimina los archivos temporales. Devuelve el número de logs fusionados.
+    """
+    main_log_filepath = os.path.join(log_dir, config["FILENAME"])
+    worker_pattern = os.path.join(log_dir, config["WORKER_FILENAME"].format(pid="*"))
+    worker_logs = sorted(glob.glob(worker_pattern))
+
+    with open(main_log_filepath, "a", encoding="utf-8") as main_log:
+        for worker_log_filepath in worker_logs:
+            main_log.write(f"\n{'-'*20} {os.path.basename(worker_log_filepath)} {'-'*20}\n")
+            with open(worker_log_filepath, "r", encoding="utf-8", errors="replace") as worker_log:
+                shutil.copyfileobj(worker_log, main_log)
+            os.remove(worker_log_filepath)
+
+    return len(worker_logs)
+
 
 def setup_main_output_dir(base_path: str, config: dict) -> str:
     """
@@ -63,45 +107,136 @@ def copy_original_document(source_path: str, output_dir: str, config: dict):
     originals_path = os.path.join(output_dir, config["OUTPUT_DIRS"]["ORIGINALS"])
     shutil.copy(source_path, originals_path)
 
-def find_best_sources(obra_path: str) -> dict:
+# Subcarpetas de una obra con estructura compleja, en orden de preferencia para el texto
+SOURCE_SUBDIRS = ("ocr_docx", "ocr_pdf", "img_pdf")
+
+def scan_obra_sources(obra_path: str) -> dict | None:
     """
-    Analiza la estructura de una obra y determina la mejor fuente para texto e imágenes.
-    Intenta primero una estructura con subcarpetas (ocr_docx, etc.) y si no, busca
-    archivos directamente en la raíz de la obra.
+    Determina la mejor fuente para texto e imágenes de una obra listando cada carpeta una
+    sola vez con os.scandir. Devuelve {"text": [...], "image": [...], "files": {ruta:
+    {"size", "mtime_ns"}}} con el tamaño y la fecha de los archivos elegidos, o None si la
+    obra no tiene fuentes válidas.
     """
-    sources = {"text": [], "image": []}
-    
+    with os.scandir(obra_path) as it:
+        root_entries = list(it)
+    listings = {}
+    for entry in root_entries:
+        if entry.name in SOURCE_SUBDIRS and entry.is_dir():
+            with os.scandir(entry.path) as it:
+                listings[entry.name] = list(it)
+
+    def matching(entries: list, extension: str) -> list:
+        return sorted((e for e in entries if e.name.endswith(extension)), key=lambda e: e.path)
+
+    text_entries, image_entries = [], []
+
     # --- Intento 1: Estructura de subcarpetas (ocr_docx, img_pdf) ---
-    ocr_docx_path = os.path.join(obra_path, 'ocr_docx')
-    ocr_pdf_path = os.path.join(obra_path, 'ocr_pdf')
-    img_pdf_path = os.path.join(obra_path, 'img_pdf')
-
-    if os.path.isdir(ocr_docx_path) and os.listdir(ocr_docx_path):
-        sources["text"] = sorted([os.path.join(ocr_docx_path, f) for f in os.listdir(ocr_docx_path) if f.endswith('.docx')])
-    elif os.path.isdir(ocr_pdf_path) and os.listdir(ocr_pdf_path):
-        sources["text"] = sorted([os.path.join(ocr_pdf_path, f) for f in os.listdir(ocr_pdf_path) if f.endswith('.pdf')])
-    elif os.path.isdir(img_pdf_path) and os.listdir(img_pdf_path):
-        sources["text"] = sorted([os.path.join(img_pdf_path, f) for f in os.listdir(img_pdf_path) if f.endswith('.pdf')])
-
-    if os.path.isdir(img_pdf_path) and os.listdir(img_pdf_path):
-        sources["image"] = sorted([os.path.join(img_pdf_path, f) for f in os.listdir(img_pdf_path) if f.endswith('.pdf')])
+    if listings.get("ocr_docx"):
+        text_entries = matching(listings["ocr_docx"], '.docx')
+    elif listings.get("ocr_pdf"):
+        text_entries = matching(listings["ocr_pdf"], '.pdf')
+    elif listings.get("img_pdf"):
+        text_entries = matching(listings["img_pdf"], '.pdf')
+
+    if listings.get("img_pdf"):
+        image_entries = matching(listings["img_pdf"], '.pdf')
     else:
-        sources["image"] = sources["text"]
+        image_entries = text_entries
 
     # --- Intento 2: Fallback a la raíz de la obra ---
-    if not sources["text"]:
-        root_files_pdf = sorted([os.path.join(obra_path, f) for f in os.listdir(obra_path) if f.endswith('.pdf')])
-        root_files_docx = sorted([os.path.join(obra_path, f) for f in os.listdir(obra_path) if f.endswith('.docx')])
-        
+    if not text_entries:
+        root_files_pdf = matching(root_entries, '.pdf')
+        root_files_docx = matching(root_entries, '.docx')
+
         # Dar prioridad a DOCX si existen
         if root_files_docx:
-            sources["text"] = root_files_docx
-            sources["image"] = root_files_docx
+            text_entries = image_entries = root_files_docx
         elif root_files_pdf:
-            sources["text"] = root_files_pdf
-            sources["image"] = root_files_pdf
+            text_entries = image_entries = root_files_pdf
+
+    if not text_entries or not image_entries:
+        return None
 
-    if not sources["text"] or not sources["image"]:
+    files = {}
+    for entry in text_entries + image_entries:
+        if entry.path not in files:
+            stat = entry.stat()
+            files[entry.path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return {"text": [e.path for e in text_entries], "image": [e.path for e in image_entries], "files": files}
+
+def find_best_sources(obra_path: str) -> dict:
+    """
+    Analiza la estructura de una obra y determina la mejor fuente para texto e imágenes.
+    Intenta primero una estructura con subcarpetas (ocr_docx, etc.) y si no, busca
+    archivos directamente en la raíz de la obra.
+    """
+    scan = scan_obra_sources(obra_path)
+    if scan is None:
         return None
-        
-    return sources
+    return {"text": scan["text"], "image": scan["image"]}
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint_sources(sources: dict, previous: dict | None = None, content_hash: bool = False) -> dict:
+    """
+    Calcula la huella de cada archivo de las fuentes de una obra: {"text": {ruta: huella},
+    "image": {ruta: huella}}, donde la huella tiene el tamaño, la fecha de modificación y,
+    si content_hash es True, el SHA-256 del contenido. El hash de un archivo cuyo tamaño y
+    fecha no cambiaron respecto a las huellas anteriores se reutiliza sin releerlo.
+    """
+    fingerprints = {}
+    for kind in ("text", "image"):
+        previous_kind = (previous or {}).get(kind, {})
+        fingerprints[kind] = {}
+        for path in sources.get(kind, []):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                fingerprints[kind][path] = None
+                continue
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if content_hash:
+                old_entry = previous_kind.get(path) or {}
+                if old_entry.get("sha256") and old_entry.get("size") == entry["size"] and old_entry.get("mtime_ns") == entry["mtime_ns"]:
+                    entry["sha256"] = old_entry["sha256"]
+                else:
+                    entry["sha256"] = _file_sha256(path)
+            fingerprints[kind][path] = entry
+    return fingerprints
+
+def _fingerprint_changed(old_entry: dict | None, new_entry: dict | None) -> bool:
+    if not old_entry or not new_entry or old_entry["size"] != new_entry["size"]:
+        return True
+    # Con hash de contenido, un archivo copiado o tocado sin cambios no cuenta como modificado
+    if old_entry.get("sha256") and new_entry.get("sha256"):
+        return old_entry["sha256"] != new_entry["sha256"]
+    return old_entry["mtime_ns"] != new_entry["mtime_ns"]
+
+def changed_source_kinds(old: dict, new: dict) -> set[str]:
+    """Devuelve qué tipos de fuente ('text', 'image') tienen archivos añadidos, eliminados o modificados."""
+    changed = set()
+    for kind in ("text", "image"):
+        old_kind, new_kind = old.get(kind, {}), new.get(kind, {})
+        if set(old_kind) != set(new_kind) or any(_fingerprint_changed(old_kind[path], new_kind[path]) for path in new_kind):
+            changed.add(kind)
+    return changed
+
+def load_source_fingerprints(path: str) -> dict | None:
+    """Lee las huellas de fuentes guardadas; devuelve None si no existen o están dañadas."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_source_fingerprints(path: str, fingerprints: dict):
+    """Guarda las huellas de fuentes con escritura atómica."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(fingerprints, f, indent=4, ensure_ascii=False)
+    os.replace(temp_path, path)
@@ -0,0 +1,45 @@
+# pipeline_status.py
+# Script para consultar el avance de un directorio de trabajo a partir de su estado persistente.
+
+import os
+import sys
+import config
+from modulos import estado_trabajos
+
+def main(work_dir: str):
+    """
+    Imprime, para cada etapa, cuántas obras están completadas, en curso, fallidas o por
+    repetir, y lista la etapa en que se encuentra cada obra pendiente y el motivo de cada fallo.
+    """
+    state_path = os.path.join(work_dir, config.JOB_STATE_CONFIG["FILENAME"])
+    if not os.path.exists(state_path):
+        print(f"ERROR: No existe la base de estado en {state_path}")
+        sys.exit(1)
+
+    state = estado_trabajos.open_state(work_dir)
+    report = state.report()
+    state.close()
+
+    print(f"--- ESTADO DEL PIPELINE EN: {work_dir} ---")
+    print(f"Obras registradas: {report['obras']}")
+    for stage in estado_trabajos.STAGES:
+        counts = report["stages"].get(stage, {})
+        print(f"  {stage:<13} completadas: {counts.get('done', 0):>6}  en curso: {counts.get('running', 0):>6}  "
+              f"fallidas: {counts.get('failed', 0):>6}  por repetir: {counts.get('pending', 0):>6}")
+
+    if report["pending_stage"]:
+        print(f"\nObras pendientes ({len(report['pending_stage'])}):")
+        for obra, stage in sorted(report["pending_stage"].items()):
+            print(f"  {obra}: reanudará en '{stage}'")
+
+    if report["failed"]:
+        print(f"\nObras con etapas fallidas ({len(report['failed'])}):")
+        for obra, reason in sorted(report["failed"].items()):
+            print(f"  {obra}: {reason}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python pipeline_status.py <ruta_al_directorio_de_trabajo>")
+        sys.exit(1)
+
+    main(sys.argv[1])
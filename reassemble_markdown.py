@@ -0,0 +1,62 @@
+# reassemble_markdown.py
+# Script para regenerar todos los Markdown finales de un directorio de trabajo
+# (ej. tras cambiar la plantilla del ensamblador), reescribiendo solo los que cambian.
+
+import os
+import sys
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import config
+from modulos import utils_fs, ensamblador_markdown
+
+def main(work_dir: str, workers: int | None = None):
+    """
+    Recorre 02_artefactos_extraidos y reensambla cada obra en un pool de procesos. Solo se
+    escriben los archivos de 03_markdown_final cuyo contenido cambiaría.
+    """
+    log_dir = os.path.join(work_dir, config.OUTPUT_DIRS["LOGS"])
+    utils_fs.setup_logging(log_dir, config.LOG_CONFIG)
+    logging.info(f"--- INICIANDO REENSAMBLAJE DE MARKDOWN EN: {work_dir} ---")
+
+    artifacts_dir = os.path.join(work_dir, config.OUTPUT_DIRS["ARTIFACTS"])
+    if not os.path.isdir(artifacts_dir):
+        logging.error(f"El directorio de artefactos no existe: {artifacts_dir}")
+        sys.exit(1)
+    os.makedirs(os.path.join(work_dir, config.OUTPUT_DIRS["FINAL_MARKDOWN"]), exist_ok=True)
+
+    doc_artifact_paths = [entry.path for entry in sorted(os.scandir(artifacts_dir), key=lambda e: e.name) if entry.is_dir()]
+    workers = workers or os.cpu_count() or 1
+    logging.info(f"  {len(doc_artifact_paths)} obras a reensamblar con {workers} procesos.")
+
+    counts = {"written": 0, "unchanged": 0, "error": 0}
+    if workers > 1 and len(doc_artifact_paths) > 1:
+        mp_context = multiprocessing.get_context(config.PARALLEL_CONFIG["START_METHOD"])
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+            # Lotes grandes: reensamblar una obra cuesta mucho menos que enviarla a otro proceso
+            chunksize = max(1, len(doc_artifact_paths) // (workers * 4))
+            results = list(zip(doc_artifact_paths, executor.map(ensamblador_markdown.reassemble_if_changed,
+                                                                  doc_artifact_paths, [work_dir] * len(doc_artifact_paths),
+                                                                  chunksize=chunksize)))
+    else:
+        results = [(path, ensamblador_markdown.reassemble_if_changed(path, work_dir)) for path in doc_artifact_paths]
+
+    for doc_artifact_path, (status, error) in results:
+        counts[status] += 1
+        if status == "written":
+            logging.debug(f"  Reescrito: {os.path.basename(doc_artifact_path)}.md")
+        elif status == "error":
+            logging.error(f"  No se pudo reensamblar la obra {os.path.basename(doc_artifact_path)}: {error}")
+
+    logging.info(f"  Reescritos: {counts['written']}. Sin cambios: {counts['unchanged']}. Con error: {counts['error']}.")
+    logging.info("\n--- REENSAMBLAJE COMPLETADO ---")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reensambla los Markdown finales que hayan cambiado.")
+    parser.add_argument("work_path", help="Ruta al directorio de trabajo existente.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Número de procesos (por defecto, uno por núcleo).")
+    args = parser.parse_args()
+
+    main(args.work_path, workers=args.workers)
@@ -28,6 +28,7 @@ def main(corpus_dir: str, work_dir: str, obra_ids: list[str]):
 
         # 1. Encontrar las mejores fuentes de texto
         logging.info("  [Paso 1 de 3] Re-identificando las mejores fuentes de texto...")
+        # Siempre desde la carpeta de la obra: el manifiesto puede ser anterior a los cambios que se reparan
         sources = utils_fs.find_best_sources(obra_path_original)
         if not sources or not sources["text"]:
             logging.error(f"  No se encontraron fuentes de texto para la obra {obra_id}. Saltando.")
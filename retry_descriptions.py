@@ -6,7 +6,7 @@ import sys
 import logging
 import json
 import config
-from modulos import utils_fs, generador_descripciones, ensamblador_markdown
+from modulos import utils_fs, generador_descripciones, ensamblador_markdown, cliente_ollama, diario_metadatos
 
 def main(work_dir: str):
     """
@@ -30,12 +30,10 @@ def main(work_dir: str):
         logging.info(f"\n{'='*60}\nVerificando Obra: {obra_dir_name}\n{'='*60}")
 
         # Verificar si hay descripciones que reintentar
-        metadata_path = os.path.join(doc_artifact_path, config.ARTIFACT_SUBDIRS["METADATA"])
         try:
-            with open(metadata_path, "r", encoding="utf-8") as f:
-                metadata = json.load(f)
+            metadata = diario_metadatos.load_metadata(doc_artifact_path)
             
-            failed_images = [img for img in metadata.get("images", []) if "Error" in str(img.get("description"))]
+            failed_images = [img for img in metadata.get("images", []) if generador_descripciones.description_failed(img)]
             if not failed_images:
                 logging.info("  No hay descripciones fallidas que reintentar.")
                 continue
@@ -59,6 +57,7 @@ def main(work_dir: str):
 
         logging.info(f"  REINTENTO COMPLETADO PARA: {obra_dir_name}")
 
+    cliente_ollama.log_endpoint_stats()
     logging.info("\n--- PROCESO DE REINTENTO COMPLETADO ---")
 
 if __name__ == "__main__":
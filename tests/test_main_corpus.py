@@ -0,0 +1,50 @@
+# tests/test_main_corpus.py
+# El planificador por etapas debe sobrevivir a la muerte de un proceso trabajador.
+
+import os
+import time
+import signal
+import logging
+import pytest
+
+pytest.importorskip("docling")
+
+import config
+import main_corpus
+from modulos import flujo_obra
+
+KILLED_OBRA = "2"
+
+def _fake_worker(obra_path, output_dir, obra_dir_name, sources):
+    """Etapas de CPU simuladas; la obra KILLED_OBRA mata su proceso como lo haría el OOM killer."""
+    if obra_dir_name == KILLED_OBRA:
+        time.sleep(0.2)
+        os.kill(os.getpid(), signal.SIGKILL)
+    time.sleep(0.05)
+    return obra_dir_name, True
+
+def _fake_describe(obra_path, output_dir, obra_dir_name):
+    return obra_dir_name, True
+
+def test_run_pipelined_survives_killed_worker(tmp_path, monkeypatch, caplog):
+    # Con fork los procesos trabajadores heredan las funciones simuladas
+    monkeypatch.setitem(config.PARALLEL_CONFIG, "START_METHOD", "fork")
+    monkeypatch.setitem(config.PARALLEL_CONFIG, "MAX_PENDING_PER_WORKER", 1)
+    monkeypatch.setattr(main_corpus, "_init_worker", lambda log_dir, output_dir: None)
+    monkeypatch.setattr(main_corpus, "_process_obra_in_worker", _fake_worker)
+    monkeypatch.setattr(main_corpus, "_describe_and_assemble", _fake_describe)
+    monkeypatch.setattr(flujo_obra, "first_pending_stage", lambda state, obra_name: "extracted")
+    (tmp_path / config.OUTPUT_DIRS["LOGS"]).mkdir()
+
+    obra_dir_names = [str(n) for n in range(1, 9)]
+    caplog.set_level(logging.INFO)
+    main_corpus.run_pipelined(str(tmp_path / "corpus"), str(tmp_path), obra_dir_names, 2, state=None, manifest={"obras": {}})
+
+    completed = {name for name in obra_dir_names if f"Obra {name} completada." in caplog.text}
+    failed = {name for name in obra_dir_names if f"Obra {name} fallida." in caplog.text}
+    assert KILLED_OBRA in failed
+    assert f"La obra {KILLED_OBRA} se perdió" in caplog.text
+    # Todas las obras terminan (ninguna queda sin enviar) y solo fallan las que estaban en el pool
+    # roto: como mucho una por hueco (2 trabajadores x 1 obra pendiente)
+    assert completed | failed == set(obra_dir_names)
+    assert len(failed) <= 2